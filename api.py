@@ -0,0 +1,253 @@
+import json
+from datetime import datetime, timedelta
+from flask import Blueprint, Response, request, abort, current_app, stream_with_context
+from models import db, Venue, Artist, Show
+from queries import isoformat, encode_cursor, decode_cursor, search_position, search_page, split_shows, record_genres, show_listing, show_cursor
+
+try:
+  # optional dependency, a faster encoder with native datetime support
+  import orjson
+except ImportError:
+  orjson = None
+
+#----------------------------------------------------------------------------#
+# JSON API.
+#----------------------------------------------------------------------------#
+# JSON views of venues, artists and shows under /api/v1, built on the same
+# queries as the HTML pages. Rows are encoded straight from the selected
+# columns; ?fields=id,name limits a response to the named fields and lists are
+# paginated with the opaque next_cursor returned by the previous page. The only
+# write is bulk show scheduling, which takes a JSON body.
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+VENUE_FIELDS = {
+  'id': Venue.id,
+  'name': Venue.name,
+  'address': Venue.address,
+  'city': Venue.city,
+  'state': Venue.state,
+  'phone': Venue.phone,
+  'website': Venue.website_link,
+  'facebook_link': Venue.facebook_link,
+  'seeking_talent': Venue.seeking_talent,
+  'seeking_description': Venue.seeking_description,
+  'image_link': Venue.image_link,
+  'upcoming_shows_count': Venue.upcoming_shows_count,
+  'past_shows_count': Venue.past_shows_count,
+  'next_show_time': Venue.next_show_time,
+  'updated_at': Venue.updated_at,
+}
+
+ARTIST_FIELDS = {
+  'id': Artist.id,
+  'name': Artist.name,
+  'city': Artist.city,
+  'state': Artist.state,
+  'phone': Artist.phone,
+  'website': Artist.website_link,
+  'facebook_link': Artist.facebook_link,
+  'seeking_venue': Artist.seeking_venue,
+  'seeking_description': Artist.seeking_description,
+  'image_link': Artist.image_link,
+  'upcoming_shows_count': Artist.upcoming_shows_count,
+  'past_shows_count': Artist.past_shows_count,
+  'next_show_time': Artist.next_show_time,
+  'updated_at': Artist.updated_at,
+}
+
+SHOW_FIELDS = ('id', 'start_time', 'venue_id', 'venue_name', 'artist_id', 'artist_name', 'artist_image_link')
+
+# fields loaded by a separate query rather than selected as columns
+LIST_EXTRAS = ('genres',)
+DETAIL_EXTRAS = ('genres', 'upcoming_shows', 'past_shows')
+
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+
+def dumps(data):
+  if orjson is not None:
+    return orjson.dumps(data)
+  return json.dumps(data, default=isoformat, separators=(',', ':'))
+
+def json_response(data, status=200):
+  return Response(dumps(data), status=status, mimetype='application/json')
+
+def requested_fields(available):
+  # the fields named by ?fields=, in the order given, or every field
+  fields = request.args.get('fields')
+  if not fields:
+    return list(available)
+  names = list(dict.fromkeys(name.strip() for name in fields.split(',') if name.strip()))
+  unknown = [name for name in names if name not in available]
+  if unknown:
+    abort(400, 'Unknown fields: ' + ', '.join(unknown))
+  return names
+
+def page_limit():
+  limit = request.args.get('limit', current_app.config['API_PAGE_SIZE'])
+  try:
+    limit = int(limit)
+  except ValueError:
+    abort(400, 'limit must be an integer')
+  if limit < 1:
+    abort(400, 'limit must be positive')
+  return min(limit, current_app.config['API_MAX_PAGE_SIZE'])
+
+def records(model, columns, names):
+  # select the requested columns of model, always with the id first so
+  # genres and cursors can be attached without selecting it twice
+  selected = [name for name in names if name in columns and name != 'id']
+  query = db.session.query(model.id, *[columns[name] for name in selected])
+  def encode(rows):
+    data = [dict(zip(['id'] + selected, row)) for row in rows]
+    if 'genres' in names and data:
+      genres = record_genres(model, [row['id'] for row in data])
+      for row in data:
+        row['genres'] = genres[row['id']]
+    return [{name: row[name] for name in names if name in row} for row in data]
+  return query, encode
+
+def record_list(model, columns):
+  names = requested_fields(list(columns) + list(LIST_EXTRAS))
+  limit = page_limit()
+  query, encode = records(model, columns, names)
+
+  cursor = request.args.get('cursor')
+  if cursor:
+    position = decode_cursor(cursor)
+    if not (isinstance(position, list) and [type(value) for value in position] == [int]):
+      abort(400, 'Invalid cursor')
+    query = query.filter(model.id > position[0])
+  rows = query.order_by(model.id).limit(limit + 1).all()
+
+  next_cursor = None
+  if len(rows) > limit:
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1][0])
+  return json_response({"data": encode(rows), "next_cursor": next_cursor})
+
+def record_detail(model, id, columns, show_column, other):
+  names = requested_fields(list(columns) + list(DETAIL_EXTRAS))
+  query, encode = records(model, columns, names)
+  row = query.filter(model.id == id).first()
+  if row is None:
+    abort(404)
+  data = encode([row])[0]
+  if 'upcoming_shows' in names or 'past_shows' in names:
+    upcoming, past = split_shows(show_column, id, other)
+    if 'upcoming_shows' in names:
+      data['upcoming_shows'] = [show._asdict() for show in upcoming]
+    if 'past_shows' in names:
+      data['past_shows'] = [show._asdict() for show in past]
+  return json_response({"data": data})
+
+def record_search(model):
+  search_term = request.args.get('search_term', '').strip()
+  cursor = request.args.get('cursor')
+  if cursor and search_position(cursor) is None:
+    abort(400, 'Invalid cursor')
+  return json_response(search_page(model, search_term, cursor=cursor, limit=page_limit()))
+
+def show_rows(rows, names):
+  return [{name: getattr(row, name) for name in names} for row in rows]
+
+#----------------------------------------------------------------------------#
+# Views.
+#----------------------------------------------------------------------------#
+
+@api.route('/venues')
+def venues():
+  return record_list(Venue, VENUE_FIELDS)
+
+@api.route('/venues/search')
+def search_venues():
+  return record_search(Venue)
+
+@api.route('/venues/<int:venue_id>')
+def venue(venue_id):
+  return record_detail(Venue, venue_id, VENUE_FIELDS, Show.venue_id, Artist)
+
+@api.route('/artists')
+def artists():
+  return record_list(Artist, ARTIST_FIELDS)
+
+@api.route('/artists/search')
+def search_artists():
+  return record_search(Artist)
+
+@api.route('/artists/<int:artist_id>')
+def artist(artist_id):
+  return record_detail(Artist, artist_id, ARTIST_FIELDS, Show.artist_id, Venue)
+
+@api.route('/shows')
+def shows():
+  names = requested_fields(SHOW_FIELDS)
+  limit = page_limit()
+  rows = db.session.execute(show_listing(request.args.get('cursor')).limit(limit + 1)).all()
+
+  next_cursor = None
+  if len(rows) > limit:
+    rows = rows[:limit]
+    next_cursor = show_cursor(rows[-1])
+  return json_response({"data": show_rows(rows, names), "next_cursor": next_cursor})
+
+@api.route('/shows/<int:show_id>')
+def show(show_id):
+  names = requested_fields(SHOW_FIELDS)
+  row = db.session.execute(show_listing().where(Show.id == show_id)).first()
+  if row is None:
+    abort(404)
+  return json_response({"data": show_rows([row], names)[0]})
+
+@api.route('/shows/batch', methods=['POST'])
+def schedule():
+  # book {"shows": [{"venue_id", "artist_id", "start_time"}, ...]} in one
+  # transaction; "dry_run": true only reports what would be created
+  body = request.get_json(silent=True)
+  shows = body.get('shows') if isinstance(body, dict) else None
+  if not isinstance(shows, list):
+    abort(400, 'Expected a JSON object with a list of shows')
+  if len(shows) > current_app.config['SCHEDULE_MAX_SHOWS']:
+    abort(400, 'At most {} shows per request'.format(current_app.config['SCHEDULE_MAX_SHOWS']))
+  dry_run = body.get('dry_run') is True
+  from scheduling import schedule_shows, summarize
+
+  try:
+    results, tags = schedule_shows(shows, timedelta(minutes=current_app.config['SHOW_LENGTH']), dry_run=dry_run)
+    if dry_run:
+      db.session.rollback()
+    else:
+      db.session.commit()
+  except Exception:
+    db.session.rollback()
+    raise
+  if tags:
+    current_app.extensions['page_cache'].invalidate(*tags)
+  return json_response({"counts": summarize(results), "results": results})
+
+@api.route('/export/<name>.<format>')
+def export(name, format):
+  # stream a whole table, or with ?since= the rows changed since then
+  from exporter import EXPORTS, MIMETYPES, export_chunks
+  if name not in EXPORTS or format not in MIMETYPES:
+    abort(404)
+  since = request.args.get('since')
+  if since:
+    try:
+      since = datetime.fromisoformat(since)
+    except ValueError:
+      abort(400, 'since must be an ISO 8601 timestamp')
+  try:
+    chunks = export_chunks(name, format, since or None, current_app.config['EXPORT_BATCH_SIZE'])
+  except ImportError:
+    abort(400, 'Parquet exports need the pyarrow package')
+  return Response(stream_with_context(chunks), mimetype=MIMETYPES[format], headers={
+    'Content-Disposition': 'attachment; filename={}.{}'.format(name, format)
+  })
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def error(error):
+  return json_response({"error": error.description}, error.code)
@@ -2,19 +2,31 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import os
 import json
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import time
+import hashlib
+import click
+from itertools import groupby
+import babel.dates
+from functools import lru_cache, wraps
+from datetime import timezone, timedelta
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, stream_with_context, jsonify, session, make_response, g
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 import logging
-from logging import Formatter, FileHandler
+from logging import FileHandler
+from flask.logging import default_handler
 from flask_wtf import Form
 from forms import *
-from flask_migrate import Migrate
-from sqlalchemy.orm import relationship
-from sqlalchemy import event
+from models import db, Venue, Artist, Show, TableVersion, venue_genre, artist_genre
+from queries import search_page, split_shows, show_listing, show_cursor, genre_ids, load_genres, set_genres, refresh_show_counters, stale_show_counters, roll_over_show_counters
+from cache import PageCache, FragmentCache, MemoryCache, NullCache
+from routing import Replicas
+from instrumentation import Instrumentation, JsonFormatter
+from api import api
+from startup import init_templates, compile_templates, STARTUP_PATHS
+from sqlalchemy.orm import selectinload
+from sqlalchemy import event, func, case
 
 #----------------------------------------------------------------------------#
 # App Config.
@@ -23,108 +35,144 @@ from sqlalchemy import event
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+init_templates(app)
+db.init_app(app)
+replicas = Replicas(app)
+# Flask-Migrate imports alembic, which only the `flask db` commands use, so
+# it is set up when the app is loaded by a command and not in server workers;
+# likewise the importer, scheduling, exporter, benchmark and loadtest modules
+# are imported by the commands, and the views, that use them
+if click.get_current_context(silent=True) is not None:
+  from flask_migrate import Migrate
+  migrate = Migrate(app, db)
+page_cache = PageCache(app)
+fragment_cache = FragmentCache(app, page_cache)
+instrumentation = Instrumentation(app)
+instrumentation.metrics.register('fyyur_fragment_cache_hits_total', 'counter',
+  'Template fragments served from the fragment cache, by fragment.', 'fragment', lambda: dict(fragment_cache.hits))
+instrumentation.metrics.register('fyyur_fragment_cache_misses_total', 'counter',
+  'Template fragments rendered and stored in the fragment cache, by fragment.', 'fragment', lambda: dict(fragment_cache.misses))
+app.register_blueprint(api)
 
 # connect to a local postgresql database
 
-#----------------------------------------------------------------------------#
-# Models.
-#----------------------------------------------------------------------------#
-# Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
-
-artist_genre = db.Table('artist_genre',
-    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id'), primary_key=True),
-    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True)
-)
-
-venue_genre = db.Table('venue_genre',
-    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id'), primary_key=True),
-    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True)
-)
-
-class Venue(db.Model):
-    __tablename__ = 'Venue'
-
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    genres = relationship("Genre", secondary=venue_genre)
-    address = db.Column(db.String(120))
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
-    phone = db.Column(db.String(120))
-    website_link = db.Column(db.String(120))
-    facebook_link = db.Column(db.String(120))
-    seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
-    seeking_description = db.Column(db.String(120))    
-    image_link = db.Column(db.String(500))
-
-class Artist(db.Model):
-    __tablename__ = 'Artist'
-
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    genres = relationship("Genre", secondary=artist_genre)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
-    phone = db.Column(db.String(120))
-    website_link = db.Column(db.String(120))
-    facebook_link = db.Column(db.String(120))
-    seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
-    seeking_description = db.Column(db.String(120))
-    image_link = db.Column(db.String(500))
-
-class Genre(db.Model):
-    __tablename__ = 'Genre'
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-
-class Show(db.Model):
-    __tablename__ = 'Show'
-
-    id = db.Column('id', db.Integer, primary_key=True)
-    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'))
-    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'))
-    start_time = db.Column(db.DateTime, nullable=False)
-
-    venue = db.relationship(Venue, backref="shows", passive_deletes=True, cascade="all")
-    artist = db.relationship(Artist, backref="shows", passive_deletes=True, cascade="all")
-
 #----------------------------------------------------------------------------#
 # Helpers.
 #----------------------------------------------------------------------------#
 
-@event.listens_for(db.session, 'after_flush')
-def delete_address_orphans(session, ctx):
-  # delete-orphan cascades only work for children with a single parent 
-  # manually delete orphans in Show with an event listener that cleans
-  # up after each flush
-
-  if any(isinstance(i, Show) for i in session.dirty):
-    query = session.query(Show).filter_by(venue_id=None)
-    orphans = query.all()
-    for orphan in orphans:
-      session.delete(orphan)
-
-    query = session.query(Show).filter_by(artist_id=None)
-    orphans = query.all()
-    for orphan in orphans:
-      session.delete(orphan)
+@app.before_request
+def warm_genres():
+  # load the genre ids once per worker, before a request writes: on SQLite the
+  # connection load_genres() writes on would wait for the request's own lock
+  if not genre_ids:
+    load_genres()
+
+def utc(value):
+  # naive local times (show start times) as naive UTC, like updated_at
+  return value.astimezone(timezone.utc).replace(tzinfo=None) if value else None
+
+def listing_version(*models):
+  # the versions of the tables shown on a listing page, bumped by every write
+  # to them including deletes, and the latest of their changes
+  names = [model.__tablename__ for model in models]
+  versions = db.session.query(TableVersion.name, TableVersion.version, TableVersion.changed_at) \
+    .filter(TableVersion.name.in_(names)).order_by(TableVersion.name).all()
+  return tuple(versions), max((changed_at for name, version, changed_at in versions), default=None)
+
+def detail_version(model, id, show_column, other):
+  # the record, its shows and the records on the other side of its shows; the
+  # upcoming count and latest past start time change as shows move into the past
+  updated_at = db.session.query(model.updated_at).filter(model.id == id).scalar()
+  if updated_at is None:
+    return None
+  now = datetime.today()
+  shows = db.session.query(
+    func.count(Show.id),
+    func.count(case((Show.start_time > now, Show.id))),
+    func.max(Show.updated_at),
+    func.max(other.updated_at),
+    func.max(case((Show.start_time <= now, Show.start_time)))
+  ).join(other).filter(show_column == id).one()
+  changes = [updated_at, shows[2], shows[3], utc(shows[4])]
+  return (updated_at,) + tuple(shows), max(filter(None, changes))
+
+def conditional(validators):
+  # answer conditional GETs with 304 Not Modified before the view runs;
+  # validators returns (version, last_modified) or None for a missing record
+  def decorator(view):
+    @wraps(view)
+    def wrapper(**kwargs):
+      # pages carrying flashed messages must not be revalidated from a copy
+      if '_flashes' in session:
+        return view(**kwargs)
+      validated = validators(**kwargs)
+      if validated is None:
+        return view(**kwargs)
+      version, last_modified = validated
+      etag = hashlib.sha1(repr(version).encode()).hexdigest()
+      # the page cache keys the body on it, so a body is only ever served
+      # under the ETag of the data it was rendered from
+      g.page_version = etag
+
+      if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+      elif request.if_modified_since and last_modified:
+        since = request.if_modified_since
+        if since.tzinfo:
+          since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        fresh = last_modified.replace(microsecond=0) <= since
+      else:
+        fresh = False
+
+      response = app.response_class(status=304) if fresh else make_response(view(**kwargs))
+      if response.status_code in (200, 304):
+        response.set_etag(etag)
+        if last_modified:
+          response.last_modified = last_modified
+        response.cache_control.no_cache = True
+      return response
+    return wrapper
+  return decorator
+
+def stream_template(template_name, **context):
+  # render a template incrementally so the response starts before every row
+  # handed to it has been produced
+  app.update_template_context(context)
+  template = app.jinja_env.get_template(template_name)
+  return Response(stream_with_context(template.generate(context)))
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+@lru_cache(maxsize=None)
+def datetime_pattern(format):
+  # compile each babel pattern once instead of on every formatted value
+  return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format))
+
+@lru_cache(maxsize=None)
+def datetime_locale(locale=babel.dates.LC_TIME):
+  return babel.Locale.parse(locale)
+
 def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+  # views pass datetime objects; strings are still accepted and parsed, with
+  # dateutil imported only then
+  if not isinstance(value, datetime):
+    import dateutil.parser
+    value = dateutil.parser.parse(value)
+  return datetime_pattern(format).apply(value, datetime_locale())
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+# every filter and extension is registered now
+if app.config['PRECOMPILE_TEMPLATES']:
+  compile_templates(app)
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -138,86 +186,62 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@conditional(lambda: listing_version(Venue))
+@page_cache.cached('venues')
 def venues():
   # shows list of venues page organized by city, state
   # replace with real venues data.
   # num_shows should be aggregated based on number of upcoming shows per venue.
 
+  # upcoming show counts are maintained on the venue rows
+  venues = db.session.query(
+    Venue.id,
+    Venue.name,
+    Venue.city,
+    Venue.state,
+    Venue.upcoming_shows_count.label('num_upcoming_shows')
+  ).order_by(Venue.state, Venue.city, Venue.name)
+
+  # rows arrive ordered by state, city so areas are grouped in one pass
   data=[]
-  # iterate through venues by city, state
-  locations = Venue.query.order_by(Venue.state, Venue.city).with_entities(Venue.city, Venue.state).distinct()
-  for location in locations:
-    # add venues located in each city, state
-    venue_list=[]
-    venues = Venue.query.order_by(Venue.name).filter_by(city=location[0], state=location[1])
-    for venue in venues:
-      num_upcoming_shows = 0
-      for show in venue.shows:
-        if show.start_time > datetime.today():
-          num_upcoming_shows += 1
-      venue_list.append({
+  for (city, state), rows in groupby(venues, key=lambda venue: (venue.city, venue.state)):
+    data.append({
+      "city": city,
+      "state": state,
+      "venues": [{
         "id": venue.id,
         "name": venue.name,
-        "num_upcoming_shows": num_upcoming_shows
-      })
-    data.append({
-      "city": location[0],
-      "state": location[1],
-      "venues": venue_list
+        "num_upcoming_shows": venue.num_upcoming_shows
+      } for venue in rows]
     })
-    
+
   return render_template('pages/venues.html', areas=data);
 
 @app.route('/venues/search', methods=['POST'])
+@replicas.read_only
 def search_venues():
   # implement search on artists with partial string search. Ensure it is case-insensitive.
 
-  search='%'+request.form.get('search_term')+'%'
-  venues = Venue.query.order_by(Venue.name).filter(Venue.name.ilike(search)).all()
-  count= Venue.query.filter(Venue.name.ilike(search)).count()
-  data=[]
-  
-  for venue in venues:    
-    data.append({
-      "id": venue.id,
-      "name": venue.name,
-      "num_upcoming_shows": Show.query.filter(Show.venue_id==venue.id, Show.start_time>datetime.today()).count()
-    })
-
-  response={
-    "count": count,
-    "data": data
-  }  
-
+  search_term = request.form.get('search_term', '').strip()
+  response = search_page(Venue, search_term, cursor=request.form.get('cursor'))
 
   return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/venues/<int:venue_id>')
+@conditional(lambda venue_id: detail_version(Venue, venue_id, Show.venue_id, Artist))
+@page_cache.cached('venue:{venue_id}')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
 
   # replace with real venue data from the Venues table, using venue_id
   try:
-    venue = Venue.query.get(venue_id)
+    venue = Venue.query.options(selectinload(Venue.genres)).get(venue_id)
+    upcoming, past = split_shows(Show.venue_id, venue.id, Artist)
+    page_cache.tag(*['artist:{}'.format(show.artist_id) for show in upcoming + past])
 
     # modify show data to fit template
-    past_shows=[]
-    upcoming_shows=[]
-    for show in venue.shows:
-      if show.start_time > datetime.today():
-        upcoming_shows.append({
-        "artist_id": show.artist.id,
-        "artist_name": show.artist.name,
-        "artist_image_link": show.artist.image_link,
-        "start_time": babel.dates.format_datetime(show.start_time, "EE MM, dd, y h:mma")
-      })
-      else:
-        past_shows.append({
-        "artist_id": show.artist.id,
-        "artist_name": show.artist.name,
-        "artist_image_link": show.artist.image_link,
-        "start_time": babel.dates.format_datetime(show.start_time, "EE MM, dd, y h:mma")
-      })
+    upcoming_shows=[show._asdict() for show in upcoming]
+    past_shows=[show._asdict() for show in past]
 
     data={
       "id": venue.id,
@@ -274,15 +298,12 @@ def create_venue_submission():
         )
       db.session.add(venue)
 
-      # insert form data for genre and venue_genres records
-      for genre in form.genres.data:
-        existing_genre = Genre.query.filter_by(name=genre).first()
-        # insert genre data as a new genre record in the db if it does not exist
-        if not existing_genre:
-          venue.genres.append(Genre(name=genre))
-        else:
-          venue.genres.append(existing_genre)
+      db.session.flush()
+
+      # insert form data for venue_genre records
+      set_genres(venue_genre, 'venue_id', venue.id, form.genres.data)
       db.session.commit()
+      page_cache.invalidate('venues')
     else:
       error = True
   except Exception:
@@ -348,20 +369,13 @@ def edit_venue_submission(venue_id):
       venue.image_link=form.image_link.data
       venue.seeking_talent=form.seeking_talent.data
       venue.seeking_description=form.seeking_description.data
-      
-      # remove existing venue-genre relations
-      venue.genres = []
-
-      # create new venue-genre relations
-      for genre in form.genres.data:
-        existing_genre = Genre.query.filter_by(name=genre).first()
-        # insert genre data as a new genre record in the db if it does not exist
-        if not existing_genre:
-          venue.genres.append(Genre(name=genre))
-        else:
-          venue.genres.append(existing_genre)
-          
+      venue.updated_at=datetime.utcnow()
+
+      # replace venue-genre relations
+      set_genres(venue_genre, 'venue_id', venue.id, form.genres.data)
+
       db.session.commit()
+      page_cache.invalidate('venues', 'venue:{}'.format(venue_id))
     else:
       error = True
   except Exception:
@@ -390,8 +404,13 @@ def delete_venue(venue_id):
   try:
     venue = Venue.query.get(venue_id)
     venue_name = venue.name
+    # artists that lose shows when the database cascades the delete
+    artist_ids = [id for (id,) in db.session.query(Show.artist_id).filter(Show.venue_id == venue.id).distinct()]
     db.session.delete(venue)
+    db.session.flush()
+    refresh_show_counters(Artist, Show.artist_id, Artist.id.in_(artist_ids))
     db.session.commit()
+    page_cache.invalidate('venues', 'venue:{}'.format(venue_id), *['artist:{}'.format(id) for id in artist_ids])
   except Exception:
     db.session.rollback()
   finally:
@@ -422,6 +441,8 @@ def delete_venue_submission(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@conditional(lambda: listing_version(Artist))
+@page_cache.cached('artists')
 def artists():
   # replace with real data returned from querying the database
   artists = Artist.query.order_by(Artist.name).all()
@@ -434,56 +455,32 @@ def artists():
   return render_template('pages/artists.html', artists=data)
 
 @app.route('/artists/search', methods=['POST'])
+@replicas.read_only
 def search_artists():
   # implement search on artists with partial string search. Ensure it is case-insensitive.
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
 
-  search='%'+request.form.get('search_term')+'%'
-  artists = Artist.query.order_by(Artist.name).filter(Artist.name.ilike(search)).all()
-  count= Artist.query.filter(Artist.name.ilike(search)).count()
-  data=[]
-  
-  for artist in artists:    
-    data.append({
-      "id": artist.id,
-      "name": artist.name,
-      "num_upcoming_shows": Show.query.filter(Show.artist_id==artist.id, Show.start_time>datetime.today()).count()
-    })
-
-  response={
-    "count": count,
-    "data": data
-  }  
+  search_term = request.form.get('search_term', '').strip()
+  response = search_page(Artist, search_term, cursor=request.form.get('cursor'))
 
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/artists/<int:artist_id>')
+@conditional(lambda artist_id: detail_version(Artist, artist_id, Show.artist_id, Venue))
+@page_cache.cached('artist:{artist_id}')
 def show_artist(artist_id):
   # shows the artist page with the given artist_id
   
   # replace with real artist data from the Artists table, using artist_id
   try:
-    artist = Artist.query.get(artist_id)
+    artist = Artist.query.options(selectinload(Artist.genres)).get(artist_id)
+    upcoming, past = split_shows(Show.artist_id, artist.id, Venue)
+    page_cache.tag(*['venue:{}'.format(show.venue_id) for show in upcoming + past])
 
     # modify show data to fit template
-    past_shows=[]
-    upcoming_shows=[]
-    for show in artist.shows:
-      if show.start_time > datetime.today():
-        upcoming_shows.append({
-          "venue_id": show.id,
-          "venue_name": show.venue.name,
-          "venue_image_link": show.venue.image_link,
-          "start_time": babel.dates.format_datetime(show.start_time, "EE MM, dd, y h:mma")
-        })
-      else:
-        past_shows.append({
-          "venue_id": show.venue.id,
-          "venue_name": show.venue.name,
-          "venue_image_link": show.venue.image_link,
-          "start_time": babel.dates.format_datetime(show.start_time, "EE MM, dd, y h:mma")
-        })
+    upcoming_shows=[show._asdict() for show in upcoming]
+    past_shows=[show._asdict() for show in past]
 
     data={
       "id": artist.id,
@@ -536,15 +533,12 @@ def create_artist_submission():
         seeking_description=form.seeking_description.data
         )
       db.session.add(artist)
-      # insert form data for genre and artist_genres records
-      for genre in form.genres.data:
-        existing_genre = Genre.query.filter_by(name=genre).first()
-        # insert genre data as a new genre record in the db if it does not exist
-        if not existing_genre:
-          artist.genres.append(Genre(name=genre))
-        else:
-          artist.genres.append(existing_genre)
+      db.session.flush()
+
+      # insert form data for artist_genre records
+      set_genres(artist_genre, 'artist_id', artist.id, form.genres.data)
       db.session.commit()
+      page_cache.invalidate('artists')
     else:
       error = True
   except Exception:
@@ -607,20 +601,13 @@ def edit_artist_submission(artist_id):
       artist.image_link=form.image_link.data
       artist.seeking_venue=form.seeking_venue.data
       artist.seeking_description=form.seeking_description.data
-      
-      # remove existing artist-genre relations
-      artist.genres = []
-
-      # create new artist-genre relations
-      for genre in form.genres.data:
-        existing_genre = Genre.query.filter_by(name=genre).first()
-        # insert genre data as a new genre record in the db if it does not exist
-        if not existing_genre:
-          artist.genres.append(Genre(name=genre))
-        else:
-          artist.genres.append(existing_genre)
+      artist.updated_at=datetime.utcnow()
+
+      # replace artist-genre relations
+      set_genres(artist_genre, 'artist_id', artist.id, form.genres.data)
 
       db.session.commit()
+      page_cache.invalidate('artists', 'artist:{}'.format(artist_id))
     else:
       error = True
   except Exception:
@@ -649,8 +636,13 @@ def delete_artist(artist_id):
   try:
     artist = Artist.query.get(artist_id)
     artist_name = artist.name
+    # venues that lose shows when the database cascades the delete
+    venue_ids = [id for (id,) in db.session.query(Show.venue_id).filter(Show.artist_id == artist.id).distinct()]
     db.session.delete(artist)
+    db.session.flush()
+    refresh_show_counters(Venue, Show.venue_id, Venue.id.in_(venue_ids))
     db.session.commit()
+    page_cache.invalidate('artists', 'artist:{}'.format(artist_id), *['venue:{}'.format(id) for id in venue_ids])
   except Exception:
     db.session.rollback()
   finally:
@@ -682,23 +674,39 @@ def delete_artist_submission(artist_id):
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@conditional(lambda: listing_version(Show, Venue, Artist))
+@page_cache.cached('shows')
 def shows():
   # displays list of shows at /shows
 
   # replace with show data ordered by descending start time
-  data=[]
-  shows = Show.query.order_by(Show.start_time.desc()).all()
-  for show in shows:
-    data.append({
-      "venue_id": show.venue.id,
-      "venue_name": show.venue.name,
-      "artist_id": show.artist.id,
-      "artist_name": show.artist.name,
-      "artist_image_link": show.artist.image_link,
-      "start_time": babel.dates.format_datetime(show.start_time, "EE MM, dd, y h:mma")
-    })
- 
-  return render_template('pages/shows.html', shows=data)
+  limit = app.config['SHOWS_PAGE_SIZE']
+  query = db.session.execute(show_listing(request.args.get('cursor')).limit(limit + 1))
+
+  page = {"next_cursor": None}
+  def rows():
+    # the extra row fetched past the limit only marks that another page exists;
+    # the cursor is set before the template reaches the pagination link
+    for count, show in enumerate(query):
+      if count == limit:
+        page["next_cursor"] = show_cursor(last)
+        break
+      last = show
+      page_cache.tag('venue:{}'.format(show.venue_id), 'artist:{}'.format(show.artist_id))
+      yield {
+        "venue_id": show.venue_id,
+        "venue_name": show.venue_name,
+        "artist_id": show.artist_id,
+        "artist_name": show.artist_name,
+        "artist_image_link": show.artist_image_link,
+        "start_time": show.start_time,
+        "venue_updated_at": show.venue_updated_at,
+        "artist_updated_at": show.artist_updated_at
+      }
+
+  if app.config['STREAM_LISTINGS']:
+    return stream_template('pages/shows.html', shows=rows(), page=page)
+  return render_template('pages/shows.html', shows=list(rows()), page=page)
 
 #  Create
 #  ----------------------------------------------------------------
@@ -716,15 +724,24 @@ def create_show_submission():
 
   form = ShowForm(request.form)
   error = False
+  rejected = []
   try:
     if form.validate():
-      show = Show(
-        venue_id=form.venue_id.data,
-        artist_id=form.artist_id.data,
-        start_time=form.start_time.data
-      )
-      db.session.add(show)
-      db.session.commit()
+      # booked like the shows of the batch API, taking the same locks: the
+      # venue and artist must exist and have no other show within SHOW_LENGTH
+      from scheduling import schedule_shows
+      results, tags = schedule_shows([{
+        'venue_id': form.venue_id.data,
+        'artist_id': form.artist_id.data,
+        'start_time': form.start_time.data
+      }], timedelta(minutes=app.config['SHOW_LENGTH']))
+      if results[0]['status'] == 'created':
+        db.session.commit()
+        page_cache.invalidate(*tags)
+      else:
+        error = True
+        rejected = [message for messages in results[0]['errors'].values() for message in messages]
+        db.session.rollback()
     else:
       error = True
   except Exception:
@@ -734,12 +751,30 @@ def create_show_submission():
     db.session.close()
   if error: 
     # on unsuccessful db insert, flash an error instead.
-    flash('An error occurred. Show could not be listed.')
+    flash(' '.join(['An error occurred. Show could not be listed.'] + rejected))
   else:
     # on successful db insert, flash success
     flash('Show was successfully listed!')
   return render_template('pages/home.html')
 
+#  Operations
+#  ----------------------------------------------------------------
+
+@app.route('/pool')
+def pool_stats():
+  # connection pool usage of this worker process, for sizing the pool
+  pool = db.engine.pool
+  stats = {
+    "pool": type(pool).__name__,
+    "status": pool.status()
+  }
+  for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+    if hasattr(pool, name):
+      stats[name] = getattr(pool, name)()
+  if replicas.replicas:
+    stats["replicas"] = replicas.status()
+  return jsonify(stats)
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -749,15 +784,387 @@ def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+# one JSON line per log record, including the timing line of every request
+log_handler = FileHandler(app.config['LOG_FILE']) if app.config['LOG_FILE'] else logging.StreamHandler()
+log_handler.setFormatter(JsonFormatter())
+app.logger.removeHandler(default_handler)
+app.logger.addHandler(log_handler)
+app.logger.setLevel(app.config['LOG_LEVEL'])
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+def explain_plan(connection, statement, parameters):
+  # query plan lines of a captured statement for the connected dialect
+  if connection.dialect.name == 'sqlite':
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)
+    return [row[-1] for row in rows]
+  rows = connection.exec_driver_sql('EXPLAIN ' + statement, parameters)
+  return [row[0] for row in rows]
+
+def scanned_table(line):
+  # the table a plan line reads whole instead of through an index, or None
+  if 'Seq Scan on' in line:
+    return line.split('Seq Scan on ', 1)[1].split()[0].strip('"')
+  if line.startswith('SCAN ') and 'USING' not in line:
+    name = line.split()[1]
+    for table in (name, name.rsplit('_', 1)[0]):
+      if table in db.metadata.tables:
+        return table
+  return None
+
+def read_requests():
+  # requests exercising every read view against the current data, with the
+  # tables they read whole by design: the listings show every row, search
+  # terms shorter than MIN_INDEXED_TERM cannot use the trigram indexes, and a
+  # genre term matches about one row in nineteen; a name is found through
+  # the indexes alone
+  venue = db.session.query(Venue.id, Venue.name).order_by(Venue.id).first()
+  artist = db.session.query(Artist.id, Artist.name).order_by(Artist.id).first()
+  return [
+    ('GET', '/venues', None, {'Venue'}),
+    ('GET', '/artists', None, {'Artist'}),
+    ('GET', '/shows', None, set()),
+    ('GET', '/venues/{}'.format(venue.id), None, set()),
+    ('GET', '/artists/{}'.format(artist.id), None, set()),
+    ('POST', '/venues/search', {'search_term': 'a'}, {'Venue', 'venue_genre'}),
+    ('POST', '/venues/search', {'search_term': venue.name}, set()),
+    ('POST', '/venues/search', {'search_term': 'jazz'}, {'Venue'}),
+    ('POST', '/artists/search', {'search_term': 'a'}, {'Artist', 'artist_genre'}),
+    ('POST', '/artists/search', {'search_term': artist.name}, set()),
+    ('POST', '/artists/search', {'search_term': 'jazz'}, {'Artist'}),
+  ]
+
+@app.cli.command('explain')
+@click.option('--strict', is_flag=True, help='Exit with an error if any query scans a full table it is not expected to.')
+def explain_command(strict):
+  """Show the query plan of every statement issued by the read views."""
+  statements = []
+  def capture(conn, cursor, statement, parameters, context, executemany):
+    # only reads have a plan worth checking; EXPLAIN cannot take the
+    # parameter sets of an executemany
+    if not executemany and statement.lstrip().upper().startswith('SELECT'):
+      statements.append((statement, parameters))
+
+  scans = 0
+  client = app.test_client()
+  for method, url, form, expected in read_requests():
+    statements.clear()
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+      client.open(url, method=method, data=form)
+    finally:
+      event.remove(db.engine, 'before_cursor_execute', capture)
+
+    click.echo('{} {} ({} queries)'.format(method, url, len(statements)))
+    with db.engine.connect() as connection:
+      for statement, parameters in statements:
+        plan = explain_plan(connection, statement, parameters)
+        click.echo('  ' + ' '.join(statement.split())[:120])
+        for line in plan:
+          table = scanned_table(line)
+          if table is None:
+            mark = ''
+          elif table in expected or table == 'Genre':
+            # Genre holds the few names of the Genres vocabulary
+            mark = '~ '
+          else:
+            mark = '! '
+            scans += 1
+          click.echo('    {}{}'.format(mark, line))
+
+  click.echo('{} unexpected full table scans (!), expected ones marked ~'.format(scans))
+  if strict and scans:
+    raise SystemExit(1)
+
+@app.cli.command('nplusone')
+@click.option('--threshold', type=click.IntRange(2), default=lambda: app.config['NPLUSONE_THRESHOLD'], help='Runs of one query shape in a request that count as N+1.')
+@click.option('--strict', is_flag=True, help='Exit with an error if any view repeats a query.')
+def nplusone_command(threshold, strict):
+  """Report the read views that run one query per row (N+1 queries)."""
+  app.config.update(NPLUSONE_DETECT=True, NPLUSONE_THRESHOLD=threshold, NPLUSONE_RAISE=False)
+  # bypass the page cache so every view runs its queries
+  page_cache.backend = NullCache()
+  client = app.test_client()
+  for method, url, form, expected in read_requests():
+    client.open(url, method=method, data=form)
+
+  report = instrumentation.nplusone_report()
+  for found in report:
+    click.echo('{} {} (worst {} runs in {} requests)'.format(found['route'], found['view'], found['worst'], found['requests']))
+    for shape, query in sorted(found['queries'].items(), key=lambda item: item[1]['count'], reverse=True):
+      via = ' via ' + ', '.join(sorted(query['relationships'])) if query['relationships'] else ''
+      click.echo('  {}x{}: {}'.format(query['count'], via, shape[:120]))
+  click.echo('{} routes with N+1 queries'.format(len(report)))
+  if strict and report:
+    raise SystemExit(1)
+
+@app.cli.command('seed')
+@click.option('--venues', type=click.IntRange(0), default=10000, show_default=True)
+@click.option('--artists', type=click.IntRange(0), default=50000, show_default=True)
+@click.option('--shows', type=click.IntRange(0), default=1000000, show_default=True)
+@click.option('--seed', 'random_seed', type=int, default=0, show_default=True, help='Seed of the random generator.')
+@click.option('--reset', is_flag=True, help='Drop and recreate every table first. Destroys all data.')
+def seed_command(venues, artists, shows, random_seed, reset):
+  """Fill an empty database with synthetic venues, artists and shows."""
+  from benchmark import seed, reset_database
+  if reset:
+    reset_database()
+  started = time.monotonic()
+  try:
+    seed(venues, artists, shows, seed=random_seed,
+      progress=lambda step: click.echo('{} done after {:.1f}s'.format(step, time.monotonic() - started)))
+  except ValueError as error:
+    raise click.ClickException('{}; pass --reset to replace it'.format(error))
+
+@app.cli.command('benchmark')
+@click.option('--iterations', type=click.IntRange(1), default=50, show_default=True, help='Timed requests per case.')
+@click.option('--case', 'names', multiple=True, metavar='NAME', help='Only run this case; repeatable.')
+@click.option('--cached', is_flag=True, help='Serve pages from the page cache instead of rendering every request.')
+@click.option('--save', type=click.Path(dir_okay=False), help='Save the results as a baseline.')
+@click.option('--compare', type=click.Path(exists=True, dir_okay=False), help='Fail if the results regress from this baseline.')
+@click.option('--tolerance', type=float, default=0.2, show_default=True, help='Allowed relative growth of p95 latency and peak memory.')
+def benchmark_command(iterations, names, cached, save, compare, tolerance):
+  """Measure the latency, queries and memory of every route."""
+  from benchmark import CASES, uncovered_routes, run, save_baseline, load_baseline, regressions
+  unknown = set(names) - {case[0] for case in CASES}
+  if unknown:
+    raise click.BadParameter('{} not one of {}'.format(', '.join(sorted(unknown)), ', '.join(case[0] for case in CASES)), param_hint='--case')
+  cases = [case for case in CASES if not names or case[0] in names]
+  if not names:
+    for endpoint, method in uncovered_routes(app, cases):
+      click.echo('warning: no case for {} {}'.format(method, endpoint), err=True)
+  if not cached:
+    page_cache.backend = NullCache()
+  # the cases post forms without a CSRF token, like a test client
+  app.config['WTF_CSRF_ENABLED'] = False
+  app.logger.setLevel(logging.WARNING)
+
+  click.echo('{:<20} {:>9} {:>9} {:>9} {:>8} {:>9}'.format('case', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'peak KB'))
+  def progress(case, result):
+    click.echo('{:<20} {p50:>9} {p95:>9} {p99:>9} {queries:>8} {peak_kb:>9}'.format(case, **result))
+  results = run(app, cases, iterations=iterations, progress=progress)
+
+  volumes = {
+    'venues': db.session.query(func.count(Venue.id)).scalar(),
+    'artists': db.session.query(func.count(Artist.id)).scalar(),
+    'shows': db.session.query(func.count(Show.id)).scalar(),
+  }
+  if save:
+    save_baseline(save, results, volumes)
+    click.echo('baseline saved to {}'.format(save))
+  if compare:
+    found = regressions(load_baseline(compare), results, tolerance)
+    for line in found:
+      click.echo('regression: ' + line, err=True)
+    if found:
+      raise SystemExit(1)
+    click.echo('no regressions from {}'.format(compare))
+
+def warn_private_page_cache():
+  # invalidations from a command only reach running servers through a shared
+  # page cache; a memory cache belongs to this process alone
+  if isinstance(page_cache.backend, MemoryCache):
+    click.echo('warning: PAGE_CACHE_TYPE=memory is private to each process, so running servers '
+      'keep their cached pages for up to PAGE_CACHE_TIMEOUT seconds; use PAGE_CACHE_TYPE=redis '
+      'to invalidate them', err=True)
+
+def show_counter_pages(venue_ids, artist_ids):
+  # the cached pages showing the counters of these venues and artists
+  return (['venues'] if venue_ids else []) + \
+    ['venue:{}'.format(id) for id in venue_ids] + ['artist:{}'.format(id) for id in artist_ids]
+
+@app.cli.command('roll-shows')
+def roll_shows_command():
+  """Move shows that have started from upcoming to past counters."""
+  warn_private_page_cache()
+  venue_ids, artist_ids = roll_over_show_counters()
+  db.session.commit()
+  page_cache.invalidate(*show_counter_pages(venue_ids, artist_ids))
+  click.echo('{} venues and artists rolled over'.format(len(venue_ids) + len(artist_ids)))
+
+@app.cli.command('reconcile-shows')
+def reconcile_shows_command():
+  """Repair show counters that have drifted from the Show table."""
+  warn_private_page_cache()
+  venue_ids = stale_show_counters(Venue, Show.venue_id, drifted=True)
+  artist_ids = stale_show_counters(Artist, Show.artist_id, drifted=True)
+  venues = refresh_show_counters(Venue, Show.venue_id, drifted=True)
+  artists = refresh_show_counters(Artist, Show.artist_id, drifted=True)
+  db.session.commit()
+  page_cache.invalidate(*show_counter_pages(venue_ids, artist_ids))
+  click.echo('{} venues and {} artists repaired'.format(venues, artists))
+
+@app.cli.command('import')
+@click.argument('kind')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', type=click.Choice(['csv', 'jsonl']), help='Input format, by default taken from the file extension.')
+@click.option('--batch-size', type=click.IntRange(1), default=lambda: app.config['IMPORT_BATCH_SIZE'], help='Records per transaction.')
+@click.option('--checkpoint', type=click.Path(dir_okay=False), help='Progress file for resuming, by default PATH.checkpoint.')
+@click.option('--restart', is_flag=True, help='Ignore an existing checkpoint and import from the first record.')
+@click.option('--rejects', type=click.Path(dir_okay=False), help='Append rejected records and their errors to this JSONL file.')
+def import_command(kind, path, format, batch_size, checkpoint, restart, rejects):
+  """Import venues, artists or shows from a CSV or JSONL file."""
+  from importer import KINDS, import_file
+  if kind not in KINDS:
+    raise click.BadParameter('not one of {}'.format(', '.join(sorted(KINDS))), param_hint='KIND')
+  warn_private_page_cache()
+  checkpoint = checkpoint or path + '.checkpoint'
+  if restart and os.path.exists(checkpoint):
+    os.remove(checkpoint)
+
+  def progress(totals):
+    elapsed = time.monotonic() - totals['started']
+    click.echo('{read} read, {imported} imported, {rejected} rejected'.format(**totals) +
+      ', {:.0f} records/s'.format((totals['read'] - totals['resumed']) / elapsed if elapsed else 0), err=True)
+
+  totals = import_file(kind, path, format=format, batch_size=batch_size, checkpoint=checkpoint,
+    rejects=rejects, progress=progress, invalidate=page_cache.invalidate)
+  click.echo('{imported} {kind} imported, {rejected} rejected'.format(kind=kind, **totals))
+
+@app.cli.command('schedule')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', type=click.Choice(['csv', 'jsonl']), help='Input format, by default taken from the file extension.')
+@click.option('--dry-run', is_flag=True, help='Check the shows without booking them.')
+@click.option('--report', type=click.Path(dir_okay=False), help='Write the result of every show to this JSONL file.')
+def schedule_command(path, format, dry_run, report):
+  """Book the shows of a CSV or JSONL file in one transaction, rejecting double bookings."""
+  from importer import read_records
+  from scheduling import schedule_shows, summarize
+  if not dry_run:
+    warn_private_page_cache()
+  numbers, shows = [], []
+  for number, record in read_records(path, format):
+    numbers.append(number)
+    shows.append(record)
+
+  try:
+    results, tags = schedule_shows(shows, timedelta(minutes=app.config['SHOW_LENGTH']), dry_run=dry_run)
+    if dry_run:
+      db.session.rollback()
+    else:
+      db.session.commit()
+  except Exception:
+    db.session.rollback()
+    raise
+  if tags:
+    page_cache.invalidate(*tags)
+
+  for number, result in zip(numbers, results):
+    result['record'] = number
+    if result['status'] == 'rejected':
+      click.echo('record {}: {}'.format(number, '; '.join(
+        '{}: {}'.format(name, ' '.join(messages)) for name, messages in result['errors'].items()
+      )), err=True)
+  if report:
+    with open(report, 'w', encoding='utf-8') as file:
+      for result in results:
+        file.write(json.dumps(result) + '\n')
+  click.echo(', '.join('{} {}'.format(count, status) for status, count in sorted(summarize(results).items())) or 'no shows')
+
+@app.cli.command('export')
+@click.argument('names', nargs=-1)
+@click.option('--format', type=click.Choice(['csv', 'jsonl', 'parquet']), default='csv', show_default=True, help='Output format.')
+@click.option('--since', type=click.DateTime(), help='Only export rows changed at or after this UTC time.')
+@click.option('--output', type=click.Path(file_okay=False), default='.', show_default=True, help='Directory the files are written to.')
+def export_command(names, format, since, output):
+  """Export the catalog tables, or the named ones, to CSV, JSONL or Parquet."""
+  from exporter import EXPORTS, export_chunks
+  unknown = set(names) - set(EXPORTS)
+  if unknown:
+    raise click.BadParameter('{} not one of {}'.format(', '.join(sorted(unknown)), ', '.join(sorted(EXPORTS))), param_hint='NAMES')
+  # rows changed while the export runs are picked up again by the next one
+  started = datetime.utcnow()
+  os.makedirs(output, exist_ok=True)
+  for name in names or sorted(EXPORTS):
+    path = os.path.join(output, '{}.{}'.format(name, format))
+    try:
+      chunks = export_chunks(name, format, since, app.config['EXPORT_BATCH_SIZE'])
+    except ImportError:
+      raise click.ClickException('Parquet exports need the pyarrow package')
+    with open(path, 'wb') as file:
+      for chunk in chunks:
+        file.write(chunk.encode() if isinstance(chunk, str) else chunk)
+    click.echo(path)
+  click.echo('next incremental export: --since {}'.format(started.isoformat(timespec='seconds')))
+
+@app.cli.command('loadtest')
+@click.option('--url', help='Server to load, by default one started locally for the run.')
+@click.option('--server-workers', type=click.IntRange(1), default=1, show_default=True, help='Worker processes of the local server; more than one needs gunicorn.')
+@click.option('--port', type=int, default=5001, show_default=True, help='Port of the local server.')
+@click.option('--workers', type=click.IntRange(1), default=8, show_default=True, help='Concurrent virtual users.')
+@click.option('--duration', type=click.IntRange(1), default=30, show_default=True, help='Seconds to run.')
+@click.option('--scenario', 'weights', multiple=True, metavar='NAME=WEIGHT', help='Weight of a scenario; repeatable, unnamed scenarios are not run.')
+@click.option('--seed', 'random_seed', type=int, default=0, show_default=True, help='Seed of the random generator.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the results to this JSON file.')
+def loadtest_command(url, server_workers, port, workers, duration, weights, random_seed, output):
+  """Run browse, search and create traffic against a server."""
+  from loadtest import SCENARIOS, start_server, run
+  scenario_weights = {}
+  for weight in weights:
+    name, _, value = weight.partition('=')
+    if name not in SCENARIOS or not value.isdigit():
+      raise click.BadParameter('expected NAME=WEIGHT with NAME one of {}'.format(', '.join(SCENARIOS)), param_hint='--scenario')
+    scenario_weights[name] = int(value)
+
+  server = None
+  if not url:
+    try:
+      server, url = start_server(port, server_workers)
+    except RuntimeError as error:
+      raise click.ClickException(str(error))
+  try:
+    results = run(url, workers=workers, duration=duration, weights=scenario_weights or None, seed=random_seed)
+  finally:
+    if server:
+      server.terminate()
+      server.wait()
+
+  click.echo('{:<28} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8}'.format('step', 'req/s', 'errors', 'p50 ms', 'p90 ms', 'p95 ms', 'p99 ms'))
+  for step, result in list(results['steps'].items()) + [('total', results['total'])]:
+    click.echo('{:<28} {:>8} {:>8.1%} {p50:>8} {p90:>8} {p95:>8} {p99:>8}'.format(
+      step, result['throughput'], result['error_rate'], **result['latency_ms']))
+  pool = results['pool']
+  if pool:
+    click.echo('pool: {max_checked_out} of {size} connections checked out at peak, overflow {max_overflow}, '
+      'saturated in {saturated:.0%} of {samples} samples'.format(**pool))
+  else:
+    click.echo('pool: no usage reported by /pool for this pool class')
+  if output:
+    with open(output, 'w') as file:
+      json.dump(results, file, indent=2)
+    click.echo('results written to {}'.format(output))
+
+@app.cli.command('compile-templates')
+def compile_templates_command():
+  """Compile every template into the bytecode cache."""
+  if app.jinja_env.bytecode_cache is None:
+    raise click.ClickException('the bytecode cache is disabled; set TEMPLATE_BYTECODE_CACHE')
+  started = time.perf_counter()
+  names = compile_templates(app)
+  click.echo('{} templates compiled in {:.0f} ms into {}'.format(
+    len(names), (time.perf_counter() - started) * 1000, app.jinja_env.bytecode_cache.directory))
+
+@app.cli.command('profile-startup')
+@click.option('--path', 'paths', multiple=True, help='Page requested by the profile; repeatable, by default {}.'.format(', '.join(STARTUP_PATHS)))
+@click.option('--limit', type=click.IntRange(1), default=15, show_default=True, help='Imports listed.')
+def profile_startup_command(paths, limit):
+  """Report the import and first request cost of a new worker."""
+  from startup import profile_startup
+  try:
+    runs = profile_startup(app.root_path, paths or STARTUP_PATHS, limit)
+  except RuntimeError as error:
+    raise click.ClickException(str(error))
+
+  cached = runs['cached']
+  click.echo('import of app: {:.0f} ms'.format(cached['import'] * 1000))
+  for name, cumulative in cached['imports']:
+    click.echo('  {:<40} {:>8.1f} ms'.format(name, cumulative * 1000))
+  click.echo('{:<28} {:>6} {:>16} {:>16} {:>12}'.format('first request', 'status', 'compiled ms', 'cached ms', 'warm ms'))
+  for compiled, cached in zip(runs['compiled']['requests'], runs['cached']['requests']):
+    click.echo('{:<28} {:>6} {:>16.1f} {:>16.1f} {:>12.1f}'.format(
+      compiled['path'], compiled['status'], compiled['first'] * 1000, cached['first'] * 1000, cached['second'] * 1000))
 
 #----------------------------------------------------------------------------#
 # Launch.
@@ -0,0 +1,263 @@
+import time
+import asyncio
+from datetime import datetime
+from itertools import groupby
+from flask import render_template, request, session
+from werkzeug.exceptions import HTTPException
+from a2wsgi import WSGIMiddleware
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+from app import app as flask_app
+from models import Venue, Artist, Show
+from queries import search_statement, search_results, split_shows_statements, genres_statement, group_genres, show_listing, show_cursor
+
+#----------------------------------------------------------------------------#
+# Async read path.
+#----------------------------------------------------------------------------#
+# An alternative way to serve the app, with an ASGI server:
+#
+#   uvicorn asgi:app --workers 2
+#
+# The venue, artist and show listings, both searches and both detail pages are
+# served by coroutines on an async engine, so one process keeps many of them
+# waiting on the database at once, and the independent queries of a page (the
+# record, its upcoming and past shows and its genres) run concurrently on
+# separate connections. Every other request, including all writes, goes to the
+# Flask app, run on ASYNC_WSGI_THREADS threads by a2wsgi.
+#
+# With read replicas configured (see routing.py), each replica also gets an
+# async engine, and the async views read from one chosen like the Flask views
+# choose theirs, sharing its connection counts and health checks; users who
+# have just written read the primary.
+#
+# Async pages are rendered from the same templates, but without the page cache,
+# conditional GETs or request timings of the Flask views. Pages that carry
+# flashed messages are left to the Flask app, which clears them from the
+# session. Needs a2wsgi and an async driver: asyncpg or aiosqlite.
+
+ASYNC_DRIVERS = {
+  'postgres': 'postgresql+asyncpg',
+  'postgresql': 'postgresql+asyncpg',
+  'sqlite': 'sqlite+aiosqlite',
+}
+
+def async_url(url):
+  scheme, separator, rest = url.partition('://')
+  return ASYNC_DRIVERS.get(scheme.split('+')[0], scheme) + separator + rest
+
+def async_engine(config, url=None):
+  # the pool settings of the sync engine; the statement timeout is passed the
+  # way asyncpg takes it
+  options = dict(config['SQLALCHEMY_ENGINE_OPTIONS'])
+  options.pop('connect_args', None)
+  if config.get('DB_STATEMENT_TIMEOUT'):
+    options['connect_args'] = {'server_settings': {'statement_timeout': str(config['DB_STATEMENT_TIMEOUT'])}}
+  url = url or config['ASYNC_DATABASE_URL'] or async_url(config['SQLALCHEMY_DATABASE_URI'])
+  return create_async_engine(url, **options)
+
+#----------------------------------------------------------------------------#
+# Views.
+#----------------------------------------------------------------------------#
+# Each view takes the engine, the request inputs and the URL arguments and
+# returns the status, template and context of its page.
+
+async def fetch(engine, statement):
+  async with engine.connect() as connection:
+    return (await connection.execute(statement)).all()
+
+async def venues(engine, inputs):
+  rows = await fetch(engine, select(
+    Venue.id,
+    Venue.name,
+    Venue.city,
+    Venue.state,
+    Venue.upcoming_shows_count.label('num_upcoming_shows')
+  ).order_by(Venue.state, Venue.city, Venue.name))
+
+  areas = [{
+    "city": city,
+    "state": state,
+    "venues": [{"id": venue.id, "name": venue.name, "num_upcoming_shows": venue.num_upcoming_shows} for venue in rows]
+  } for (city, state), rows in groupby(rows, key=lambda venue: (venue.city, venue.state))]
+  return 200, 'pages/venues.html', {'areas': areas}
+
+async def artists(engine, inputs):
+  rows = await fetch(engine, select(Artist.id, Artist.name).order_by(Artist.name))
+  return 200, 'pages/artists.html', {'artists': [{"id": artist.id, "name": artist.name} for artist in rows]}
+
+async def shows(engine, inputs):
+  limit = flask_app.config['SHOWS_PAGE_SIZE']
+  rows = await fetch(engine, show_listing(inputs['cursor']).limit(limit + 1))
+  page = {"next_cursor": show_cursor(rows[limit - 1]) if len(rows) > limit else None}
+  data = [{
+    "venue_id": show.venue_id,
+    "venue_name": show.venue_name,
+    "artist_id": show.artist_id,
+    "artist_name": show.artist_name,
+    "artist_image_link": show.artist_image_link,
+    "start_time": show.start_time,
+    "venue_updated_at": show.venue_updated_at,
+    "artist_updated_at": show.artist_updated_at
+  } for show in rows[:limit]]
+  return 200, 'pages/shows.html', {'shows': data, 'page': page}
+
+def search(model, template):
+  async def view(engine, inputs):
+    limit = flask_app.config['SEARCH_PAGE_SIZE']
+    statement = search_statement(model, inputs['search_term'].strip(), engine.dialect.name, inputs['cursor'], limit)
+    results = search_results(await fetch(engine, statement), limit)
+    return 200, template, {'results': results, 'search_term': inputs['search_term']}
+  return view
+
+def detail(model, show_column, other, fields, name, template):
+  async def view(engine, inputs, **kwargs):
+    id = kwargs[name + '_id']
+    upcoming, past = split_shows_statements(show_column, id, other, datetime.today())
+    records, upcoming, past, genres = await asyncio.gather(
+      fetch(engine, select(*[getattr(model, column) for column in fields.values()]).where(model.id == id)),
+      fetch(engine, upcoming),
+      fetch(engine, past),
+      fetch(engine, genres_statement(model, [id])),
+    )
+    if not records:
+      return 404, 'errors/404.html', {}
+
+    data = dict(zip(fields, records[0]))
+    data.update({
+      "genres": group_genres(genres, [id])[id],
+      "past_shows": [show._asdict() for show in past],
+      "upcoming_shows": [show._asdict() for show in upcoming],
+      "past_shows_count": len(past),
+      "upcoming_shows_count": len(upcoming)
+    })
+    return 200, template, {name: data}
+  return view
+
+# template field -> model column of the detail pages
+VENUE_FIELDS = {
+  'id': 'id', 'name': 'name', 'address': 'address', 'city': 'city', 'state': 'state', 'phone': 'phone',
+  'website': 'website_link', 'facebook_link': 'facebook_link', 'seeking_talent': 'seeking_talent',
+  'seeking_description': 'seeking_description', 'image_link': 'image_link',
+}
+ARTIST_FIELDS = {
+  'id': 'id', 'name': 'name', 'city': 'city', 'state': 'state', 'phone': 'phone',
+  'website': 'website_link', 'facebook_link': 'facebook_link', 'seeking_venue': 'seeking_venue',
+  'seeking_description': 'seeking_description', 'image_link': 'image_link',
+}
+
+# Flask endpoint -> async view
+VIEWS = {
+  'venues': venues,
+  'search_venues': search(Venue, 'pages/search_venues.html'),
+  'show_venue': detail(Venue, Show.venue_id, Artist, VENUE_FIELDS, 'venue', 'pages/show_venue.html'),
+  'artists': artists,
+  'search_artists': search(Artist, 'pages/search_artists.html'),
+  'show_artist': detail(Artist, Show.artist_id, Venue, ARTIST_FIELDS, 'artist', 'pages/show_artist.html'),
+  'shows': shows,
+}
+
+#----------------------------------------------------------------------------#
+# Application.
+#----------------------------------------------------------------------------#
+
+class AsyncReads:
+
+    def __init__(self, app, views=VIEWS):
+        self.app = app
+        self.views = views
+        self.wsgi = WSGIMiddleware(app, workers=app.config['ASYNC_WSGI_THREADS'])
+        self.engine = async_engine(app.config)
+        self.replicas = app.extensions.get('replicas')
+        for replica in self.replicas.replicas if self.replicas else ():
+            replica.attach_async(async_engine(app.config, async_url(replica.uri)))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http' or scope['method'] not in ('GET', 'POST'):
+            return await self.wsgi(scope, receive, send)
+
+        adapter = self.app.url_map.bind('localhost')
+        try:
+            endpoint, kwargs = adapter.match(scope['path'], method=scope['method'])
+        except HTTPException:
+            endpoint, kwargs = None, {}
+        view = self.views.get(endpoint)
+        if view is None:
+            return await self.wsgi(scope, receive, send)
+
+        body = await read_body(receive)
+        context = self.request_context(scope, body)
+        # the request context is never held across an await, since every
+        # coroutine of the loop shares it
+        with context:
+            if '_flashes' in session:
+                inputs = None
+            else:
+                inputs = {
+                    'cursor': request.values.get('cursor'),
+                    'search_term': request.form.get('search_term', ''),
+                }
+                engine = self.read_engine(time.time() < session.get('primary_until', 0))
+        if inputs is None:
+            return await self.wsgi(scope, replay(body), send)
+
+        try:
+            status, template, data = await view(engine, inputs, **kwargs)
+        except Exception:
+            self.app.logger.exception('async view {} failed'.format(endpoint))
+            status, template, data = 500, 'errors/500.html', {}
+        with context:
+            page = render_template(template, **data).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'text/html; charset=utf-8'), (b'content-length', str(len(page)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': page})
+
+    def read_engine(self, primary):
+        # the async engine of a healthy replica, or of the primary for users
+        # who have just written or when no replica is healthy
+        replica = self.replicas.choose() if self.replicas and self.replicas.replicas and not primary else None
+        return replica.async_engine if replica else self.engine
+
+    def request_context(self, scope, body):
+        server = scope.get('server') or ('localhost', None)
+        host = server[0] + (':{}'.format(server[1]) if server[1] else '')
+        return self.app.test_request_context(
+            scope['path'],
+            base_url='{}://{}{}'.format(scope.get('scheme', 'http'), host, scope.get('root_path', '')),
+            method=scope['method'],
+            query_string=scope['query_string'],
+            headers=[(name.decode('latin-1'), value.decode('latin-1')) for name, value in scope['headers']],
+            data=body,
+        )
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                for replica in self.replicas.replicas if self.replicas else ():
+                    await replica.async_engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+async def read_body(receive):
+  chunks = []
+  while True:
+    message = await receive()
+    chunks.append(message.get('body', b''))
+    if not message.get('more_body'):
+      return b''.join(chunks)
+
+def replay(body):
+  # a receive callable handing an already read body to the Flask app
+  async def receive():
+    return {'type': 'http.request', 'body': body, 'more_body': False}
+  return receive
+
+app = AsyncReads(flask_app)
@@ -0,0 +1,316 @@
+import json
+import time
+import random
+import tracemalloc
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, text
+from forms import Genres
+from models import db, Venue, Artist, Show, venue_genre, artist_genre
+from queries import load_genres, refresh_show_counters
+from search import SEARCHABLE, search_table
+
+#----------------------------------------------------------------------------#
+# Synthetic data.
+#----------------------------------------------------------------------------#
+# seed() fills an empty database with generated venues, artists and shows so
+# every route can be measured at realistic volumes. Rows are written with
+# explicit ids in executemany batches; benchmark cases pick ids at random from
+# the seeded ranges.
+
+WORDS = (
+  'Blue', 'Velvet', 'Hall', 'Room', 'Sound', 'Garden', 'Electric', 'Lounge', 'Park', 'Square',
+  'Golden', 'Night', 'Club', 'Band', 'Wild', 'Sax', 'Quartet', 'Theatre', 'House', 'Stage',
+)
+CITIES = (
+  ('San Francisco', 'CA'), ('New York', 'NY'), ('Austin', 'TX'), ('Seattle', 'WA'), ('Chicago', 'IL'),
+  ('Nashville', 'TN'), ('Denver', 'CO'), ('Boston', 'MA'), ('Portland', 'OR'), ('Atlanta', 'GA'),
+)
+
+def name(rng, index):
+  return '{} {} {}'.format(rng.choice(WORDS), rng.choice(WORDS), index)
+
+def venue_row(rng, id):
+  city, state = rng.choice(CITIES)
+  return {
+    'id': id, 'name': name(rng, id), 'city': city, 'state': state,
+    'address': '{} Main Street'.format(id), 'phone': '555-555-{:04d}'.format(id % 10000),
+    'website_link': 'https://example.com/venues/{}'.format(id),
+    'facebook_link': 'https://www.facebook.com/venue{}'.format(id),
+    'image_link': 'https://example.com/venues/{}.jpg'.format(id),
+    'seeking_talent': rng.random() < 0.3, 'seeking_description': '',
+  }
+
+def artist_row(rng, id):
+  city, state = rng.choice(CITIES)
+  return {
+    'id': id, 'name': name(rng, id), 'city': city, 'state': state,
+    'phone': '555-555-{:04d}'.format(id % 10000),
+    'website_link': 'https://example.com/artists/{}'.format(id),
+    'facebook_link': 'https://www.facebook.com/artist{}'.format(id),
+    'image_link': 'https://example.com/artists/{}.jpg'.format(id),
+    'seeking_venue': rng.random() < 0.3, 'seeking_description': '',
+  }
+
+def insert_batches(table, rows, batch_size):
+  batch = []
+  for row in rows:
+    batch.append(row)
+    if len(batch) == batch_size:
+      db.session.execute(table.insert(), batch)
+      batch = []
+  if batch:
+    db.session.execute(table.insert(), batch)
+
+def reset_database():
+  # drop and recreate every table, including SQLite's search index, which
+  # drop_all() does not know about
+  db.drop_all()
+  if db.engine.dialect.name == 'sqlite':
+    for tablename in SEARCHABLE:
+      db.session.execute(text('DROP TABLE IF EXISTS ' + search_table(tablename)))
+    db.session.commit()
+  db.create_all()
+
+def seed(venues, artists, shows, seed=0, batch_size=5000, progress=None):
+  # shows start up to a year either side of now, so both upcoming and past
+  # shows exist for every view
+  if db.session.query(Venue.id).first() or db.session.query(Artist.id).first():
+    raise ValueError('the database already has venues or artists')
+  rng = random.Random(seed)
+  genre_ids = list(load_genres().values())
+  now = datetime.today().replace(microsecond=0)
+
+  def genres(column, count):
+    for id in range(1, count + 1):
+      for genre_id in rng.sample(genre_ids, rng.randint(1, 3)):
+        yield {column: id, 'genre_id': genre_id}
+
+  steps = (
+    ('venues', Venue.__table__, (venue_row(rng, id) for id in range(1, venues + 1))),
+    ('venue genres', venue_genre, genres('venue_id', venues)),
+    ('artists', Artist.__table__, (artist_row(rng, id) for id in range(1, artists + 1))),
+    ('artist genres', artist_genre, genres('artist_id', artists)),
+    ('shows', Show.__table__, ({
+      'id': id,
+      'venue_id': rng.randint(1, venues),
+      'artist_id': rng.randint(1, artists),
+      'start_time': now + timedelta(hours=rng.randint(-365 * 24, 365 * 24)),
+    } for id in range(1, shows + 1) if venues and artists)),
+  )
+  for label, table, rows in steps:
+    insert_batches(table, rows, batch_size)
+    db.session.commit()
+    if progress:
+      progress(label)
+
+  refresh_show_counters(Venue, Show.venue_id)
+  refresh_show_counters(Artist, Show.artist_id)
+  if db.engine.dialect.name == 'postgresql':
+    # explicit ids leave the sequences behind the data
+    for model in (Venue, Artist, Show):
+      db.session.execute(text(
+        "SELECT setval(pg_get_serial_sequence('\"{0}\"', 'id'), coalesce(max(id), 1)) FROM \"{0}\""
+        .format(model.__tablename__)
+      ))
+  db.session.commit()
+  if progress:
+    progress('show counters')
+
+#----------------------------------------------------------------------------#
+# Benchmark cases.
+#----------------------------------------------------------------------------#
+# Each case is one request: a name, the method, a URL pattern filled from the
+# ids chosen for the iteration and optional form data. {venue}, {artist} and
+# {show} are existing rows; {new_venue} and {new_artist} are rows created,
+# untimed, just before the request, for the cases that delete them.
+
+def venue_form(rng):
+  city, state = rng.choice(CITIES)
+  return {
+    'name': name(rng, rng.randint(1, 10 ** 6)), 'city': city, 'state': state,
+    'address': '1 Benchmark Road', 'phone': '555-555-0000',
+    'genres': [genre.value for genre in rng.sample(list(Genres), 2)],
+    'website_link': 'https://example.com', 'facebook_link': 'https://www.facebook.com/benchmark',
+    'image_link': 'https://example.com/image.jpg', 'seeking_description': '',
+  }
+
+def artist_form(rng):
+  form = venue_form(rng)
+  del form['address']
+  return form
+
+def show_form(rng, ids):
+  return {
+    'venue_id': ids['venue'], 'artist_id': ids['artist'],
+    'start_time': (datetime.today() + timedelta(days=rng.randint(1, 365))).strftime('%Y-%m-%d %H:%M:%S'),
+  }
+
+def schedule_body(rng, ids):
+  # a short tour of the artist, usually free of double bookings
+  start = datetime.today().replace(hour=20, minute=0, second=0, microsecond=0) + timedelta(days=rng.randint(400, 4000))
+  return {'shows': [
+    {'venue_id': rng.randint(1, ids['venue']), 'artist_id': ids['artist'], 'start_time': (start + timedelta(days=day)).isoformat()}
+    for day in range(5)
+  ]}
+
+def search_form(rng):
+  return {'search_term': rng.choice(WORDS).lower()[:rng.randint(2, 5)]}
+
+CASES = (
+  ('home', 'GET', '/', None),
+  ('venues', 'GET', '/venues', None),
+  ('venue', 'GET', '/venues/{venue}', None),
+  ('venue search', 'POST', '/venues/search', lambda rng, ids: search_form(rng)),
+  ('venue form', 'GET', '/venues/create', None),
+  ('venue create', 'POST', '/venues/create', lambda rng, ids: venue_form(rng)),
+  ('venue edit form', 'GET', '/venues/{venue}/edit', None),
+  ('venue edit', 'POST', '/venues/{venue}/edit', lambda rng, ids: venue_form(rng)),
+  ('venue delete', 'DELETE', '/venues/{new_venue}', None),
+  ('venue delete form', 'POST', '/venues/{new_venue}/delete', None),
+  ('artists', 'GET', '/artists', None),
+  ('artist', 'GET', '/artists/{artist}', None),
+  ('artist search', 'POST', '/artists/search', lambda rng, ids: search_form(rng)),
+  ('artist form', 'GET', '/artists/create', None),
+  ('artist create', 'POST', '/artists/create', lambda rng, ids: artist_form(rng)),
+  ('artist edit form', 'GET', '/artists/{artist}/edit', None),
+  ('artist edit', 'POST', '/artists/{artist}/edit', lambda rng, ids: artist_form(rng)),
+  ('artist delete', 'DELETE', '/artists/{new_artist}', None),
+  ('artist delete form', 'POST', '/artists/{new_artist}/delete', None),
+  ('shows', 'GET', '/shows', None),
+  ('show form', 'GET', '/shows/create', None),
+  ('show create', 'POST', '/shows/create', show_form),
+  ('pool', 'GET', '/pool', None),
+  ('metrics', 'GET', '/metrics', None),
+  ('api venues', 'GET', '/api/v1/venues', None),
+  ('api venue', 'GET', '/api/v1/venues/{venue}', None),
+  ('api venue search', 'GET', '/api/v1/venues/search?search_term=sound', None),
+  ('api artists', 'GET', '/api/v1/artists', None),
+  ('api artist', 'GET', '/api/v1/artists/{artist}', None),
+  ('api artist search', 'GET', '/api/v1/artists/search?search_term=band', None),
+  ('api shows', 'GET', '/api/v1/shows', None),
+  ('api show', 'GET', '/api/v1/shows/{show}', None),
+  ('api schedule', 'POST', '/api/v1/shows/batch', schedule_body),
+  ('api export', 'GET', '/api/v1/export/venues.csv', None),
+)
+
+def uncovered_routes(app, cases):
+  # (endpoint, method) pairs of the app that no case requests
+  adapter = app.url_map.bind('localhost')
+  covered = set()
+  for case, method, url, data in cases:
+    path = url.split('?')[0].format(venue=1, artist=1, show=1, new_venue=1, new_artist=1)
+    covered.add((adapter.match(path, method=method)[0], method))
+  routes = set()
+  for rule in app.url_map.iter_rules():
+    if rule.endpoint != 'static':
+      routes.update((rule.endpoint, method) for method in rule.methods - {'HEAD', 'OPTIONS'})
+  return sorted(routes - covered)
+
+def percentile(values, fraction):
+  # nearest-rank percentile of sorted values, None for no values
+  return values[max(0, min(len(values) - 1, int(round(fraction * len(values))) - 1))] if values else None
+
+def new_record(rng, model):
+  row = (venue_row if model is Venue else artist_row)(rng, rng.randint(1, 10 ** 6))
+  del row['id']
+  id = db.session.execute(model.__table__.insert(), row).inserted_primary_key[0]
+  db.session.commit()
+  return id
+
+#----------------------------------------------------------------------------#
+# Runner.
+#----------------------------------------------------------------------------#
+
+def run(app, cases=CASES, iterations=50, warmup=3, seed=0, progress=None):
+  # latency percentiles (ms), queries per request and peak traced memory (KB)
+  # of every case; memory is measured on one extra request so tracing does not
+  # slow the timed ones
+  rng = random.Random(seed)
+  statements = []
+  def count(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+
+  bounds = {
+    'venue': db.session.query(func.max(Venue.id)).scalar() or 1,
+    'artist': db.session.query(func.max(Artist.id)).scalar() or 1,
+    'show': db.session.query(func.max(Show.id)).scalar() or 1,
+  }
+  db.session.remove()
+
+  def timed_request(case, method, url, data):
+    ids = {name: rng.randint(1, bound) for name, bound in bounds.items()}
+    if '{new_venue}' in url:
+      ids['new_venue'] = new_record(rng, Venue)
+    if '{new_artist}' in url:
+      ids['new_artist'] = new_record(rng, Artist)
+    db.session.remove()
+    form = data(rng, ids) if data else None
+    client = app.test_client(use_cookies=False)
+    started = time.perf_counter()
+    # the API takes JSON bodies, the pages form posts
+    body = {'json': form} if url.startswith('/api/') else {'data': form}
+    response = client.open(url.format(**ids), method=method, **body)
+    elapsed = time.perf_counter() - started
+    response.close()
+    if response.status_code >= 500:
+      raise RuntimeError('{} answered {}'.format(case, response.status_code))
+    return elapsed
+
+  results = {}
+  event.listen(db.engine, 'before_cursor_execute', count)
+  try:
+    for case, method, url, data in cases:
+      for _ in range(warmup):
+        timed_request(case, method, url, data)
+      timings, queries = [], []
+      for _ in range(iterations):
+        statements.clear()
+        timings.append(timed_request(case, method, url, data))
+        queries.append(len(statements))
+
+      tracemalloc.start()
+      timed_request(case, method, url, data)
+      peak = tracemalloc.get_traced_memory()[1]
+      tracemalloc.stop()
+
+      timings.sort()
+      results[case] = {
+        'p50': round(percentile(timings, 0.50) * 1000, 2),
+        'p95': round(percentile(timings, 0.95) * 1000, 2),
+        'p99': round(percentile(timings, 0.99) * 1000, 2),
+        'queries': max(queries),
+        'peak_kb': round(peak / 1024),
+      }
+      if progress:
+        progress(case, results[case])
+  finally:
+    event.remove(db.engine, 'before_cursor_execute', count)
+  return results
+
+#----------------------------------------------------------------------------#
+# Baselines.
+#----------------------------------------------------------------------------#
+# A baseline is a saved run. A later run regresses when a case runs more
+# queries, or its p95 latency or peak memory grows by more than the tolerance
+# and a small absolute margin that absorbs the noise of very fast cases.
+
+def save_baseline(path, results, volumes):
+  with open(path, 'w') as file:
+    json.dump({'volumes': volumes, 'results': results}, file, indent=2, sort_keys=True)
+
+def load_baseline(path):
+  with open(path) as file:
+    return json.load(file)
+
+def regressions(baseline, results, tolerance=0.2):
+  found = []
+  for case, result in results.items():
+    before = baseline['results'].get(case)
+    if before is None:
+      continue
+    if result['queries'] > before['queries']:
+      found.append('{}: {} queries per request, was {}'.format(case, result['queries'], before['queries']))
+    for metric, unit, margin in (('p95', 'ms', 1), ('peak_kb', 'KB', 64)):
+      if result[metric] > before[metric] * (1 + tolerance) + margin:
+        found.append('{}: {} {}{}, was {}{}'.format(case, metric, result[metric], unit, before[metric], unit))
+  return found
@@ -0,0 +1,251 @@
+import time
+import pickle
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import request, session, g, current_app, make_response
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+#----------------------------------------------------------------------------#
+# Backends.
+#----------------------------------------------------------------------------#
+# A backend stores values with a timeout (get, set, delete) and integer
+# counters that never expire (counters, incr). MemoryCache is private to one
+# worker process; RedisCache is shared by every worker using the same server.
+
+class NullCache:
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, timeout):
+        pass
+
+    def counters(self, keys):
+        return [0 for key in keys]
+
+    def incr(self, key):
+        return 0
+
+    def delete(self, key):
+        pass
+
+class MemoryCache:
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires and expires < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.entries[key] = (time.time() + timeout if timeout else None, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def counters(self, keys):
+        # counters live outside the LRU so an evicted counter can never
+        # reset to a value a cached entry was stored with
+        return [self.values.get(key, 0) for key in keys]
+
+    def incr(self, key):
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + 1
+            return self.values[key]
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+class RedisCache:
+
+    def __init__(self, url, prefix='fyyur:'):
+        # optional dependency, only needed when the shared backend is used
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value, timeout):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=timeout or None)
+
+    def counters(self, keys):
+        if not keys:
+            return []
+        values = self.client.mget([self.prefix + key for key in keys])
+        return [int(value or 0) for value in values]
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+def make_backend(config, prefix='PAGE_CACHE'):
+  # the backend configured by PREFIX_TYPE, PREFIX_SIZE and PREFIX_URL
+  kind = config.get(prefix + '_TYPE', 'memory')
+  if kind == 'memory':
+    return MemoryCache(config.get(prefix + '_SIZE', 1024))
+  if kind == 'redis':
+    return RedisCache(config[prefix + '_URL'])
+  return NullCache()
+
+#----------------------------------------------------------------------------#
+# Page cache.
+#----------------------------------------------------------------------------#
+# Rendered pages are cached per path and query string. Every page carries tags
+# naming the records it shows ('venue:7', 'venues', 'shows'); invalidating a
+# tag bumps its version, and a cached page is only served while the versions
+# of all its tags are unchanged. Pages also expire after PAGE_CACHE_TIMEOUT
+# seconds so the split between upcoming and past shows stays current.
+#
+# Pages answering conditional GETs are also keyed on the version of the data
+# their ETag is computed from (g.page_version), read from the database on every
+# request: writes the tags miss, from another process with a memory cache or
+# shows starting as time passes, change the key instead of serving an old body
+# under a new ETag.
+
+class PageCache:
+
+    def __init__(self, app=None):
+        self.backend = NullCache()
+        self.timeout = 60
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.backend = make_backend(app.config)
+        self.timeout = app.config.get('PAGE_CACHE_TIMEOUT', 60)
+        # for blueprints that write records and cannot import the app
+        app.extensions['page_cache'] = self
+
+    def tag_versions(self, tags):
+        tags = sorted(tags)
+        return dict(zip(tags, self.backend.counters(['tag:' + tag for tag in tags])))
+
+    def tag(self, *tags):
+        # add tags to the page being rendered, for records only known once
+        # the view has queried them
+        g.setdefault('page_cache_tags', set()).update(tags)
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.backend.incr('tag:' + tag)
+
+    def cached(self, *tags):
+        # tags may reference the view's arguments, e.g. 'venue:{venue_id}'
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                # pages carrying flashed messages are personal to one visitor
+                if '_flashes' in session:
+                    return view(**kwargs)
+
+                key = 'page:' + request.full_path
+                if g.get('page_version'):
+                    key += '@' + g.page_version
+                entry = self.backend.get(key)
+                if entry is not None:
+                    versions, body, mimetype = entry
+                    if self.tag_versions(versions) == versions:
+                        return current_app.response_class(body, mimetype=mimetype)
+
+                # versions are read before rendering so an invalidation that
+                # races with the view leaves the stored page already stale
+                g.page_cache_tags = {tag.format(**kwargs) for tag in tags}
+                versions = self.tag_versions(g.page_cache_tags)
+                response = make_response(view(**kwargs))
+                if response.status_code == 200 and not response.is_streamed and '_flashes' not in session:
+                    versions.update(self.tag_versions(g.page_cache_tags - set(versions)))
+                    self.backend.set(key, (versions, response.get_data(), response.mimetype), self.timeout)
+                return response
+            return wrapper
+        return decorator
+
+#----------------------------------------------------------------------------#
+# Fragment cache.
+#----------------------------------------------------------------------------#
+# Parts of a page that repeat across pages, such as the show tiles of the
+# listing and detail pages, are cached on their own with the cache tag:
+#
+#   {% cache 'show-tile', show.start_time, show.artist_updated_at,
+#            tags=['artist:' ~ show.artist_id] %}...{% endcache %}
+#
+# A fragment is keyed on its name, its tags, the page cache versions of those
+# tags and the remaining values, which include the updated_at of each record
+# it shows. A changed record therefore changes the key, and the page cache
+# invalidations of the create, edit and delete handlers ('venue:7') bump the
+# tag versions so the fragments of a deleted record are not served either.
+# Hits and misses per fragment name are exported on /metrics.
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        tags = nodes.List([])
+        while parser.stream.skip_if('comma'):
+            if parser.stream.current.test('name:tags') and parser.stream.look().test('assign'):
+                parser.stream.skip(2)
+                tags = parser.parse_expression()
+            else:
+                args.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        call = self.call_method('render_fragment', [args[0], nodes.List(args[1:]), tags])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def render_fragment(self, name, values, tags, caller):
+        return self.environment.fragment_cache.fetch(name, values, tags, caller)
+
+class FragmentCache:
+
+    def __init__(self, app=None, page_cache=None):
+        self.backend = NullCache()
+        self.page_cache = page_cache
+        self.timeout = 0
+        self.lock = threading.Lock()
+        # fragment name -> count, for /metrics
+        self.hits = {}
+        self.misses = {}
+        if app is not None:
+            self.init_app(app, page_cache)
+
+    def init_app(self, app, page_cache=None):
+        self.backend = make_backend(app.config, 'FRAGMENT_CACHE')
+        self.page_cache = page_cache or self.page_cache
+        self.timeout = app.config.get('FRAGMENT_CACHE_TIMEOUT', 0)
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.fragment_cache = self
+        app.extensions['fragment_cache'] = self
+
+    def fetch(self, name, values, tags, render):
+        versions = self.page_cache.tag_versions(tags) if self.page_cache and tags else {}
+        key = 'fragment:' + repr((name, sorted(versions.items()), values))
+        fragment = self.backend.get(key)
+        counts = self.misses if fragment is None else self.hits
+        with self.lock:
+            counts[name] = counts.get(name, 0) + 1
+        if fragment is None:
+            fragment = str(render())
+            self.backend.set(key, fragment, self.timeout)
+        return Markup(fragment)
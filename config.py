@@ -1,5 +1,15 @@
 import os
-SECRET_KEY = os.urandom(32)
+from sqlalchemy.pool import NullPool
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+def env_flag(name, default):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+# Set SECRET_KEY when running several worker processes, so sessions and CSRF
+# tokens signed by one are accepted by the others
+SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -10,4 +20,116 @@ DEBUG = True
 
 
 # IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgres:///fyyurapp'
\ No newline at end of file
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql:///fyyurapp')
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Connection pool, sized per worker process. DB_NULL_POOL opens a connection
+# per checkout and leaves pooling to an external pooler such as PgBouncer.
+SQLALCHEMY_ENGINE_OPTIONS = {}
+if not SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+    if env_flag('DB_NULL_POOL', False):
+        SQLALCHEMY_ENGINE_OPTIONS['poolclass'] = NullPool
+    else:
+        SQLALCHEMY_ENGINE_OPTIONS.update(
+            pool_size=env_int('DB_POOL_SIZE', 5),
+            max_overflow=env_int('DB_MAX_OVERFLOW', 10),
+            pool_timeout=env_int('DB_POOL_TIMEOUT', 30),
+            # seconds before a connection is replaced, to outlive failovers
+            # and server-side idle timeouts
+            pool_recycle=env_int('DB_POOL_RECYCLE', 1800),
+        )
+    # test connections on checkout so stale ones are replaced transparently
+    SQLALCHEMY_ENGINE_OPTIONS['pool_pre_ping'] = env_flag('DB_POOL_PRE_PING', True)
+
+    # milliseconds, 0 disables the timeout
+    DB_STATEMENT_TIMEOUT = env_int('DB_STATEMENT_TIMEOUT', 0)
+    if DB_STATEMENT_TIMEOUT:
+        SQLALCHEMY_ENGINE_OPTIONS['connect_args'] = {
+            'options': '-c statement_timeout={}'.format(DB_STATEMENT_TIMEOUT)
+        }
+
+# Read replicas for the queries of GET requests and read-only POST views,
+# comma separated in DATABASE_REPLICA_URLS; without any, every query runs on
+# the primary. REPLICA_SELECTION is 'round-robin' or 'least-connections'.
+# Copies of a SQLite database opened read-only serve to try it locally:
+# sqlite:///file:/tmp/replica.db?mode=ro&uri=true
+SQLALCHEMY_REPLICA_URIS = [uri.strip() for uri in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if uri.strip()]
+REPLICA_SELECTION = os.environ.get('REPLICA_SELECTION', 'round-robin')
+# seconds a user's reads stay on the primary after a request of theirs commits
+# changes, longer than the replication lag
+REPLICA_STICKY_SECONDS = env_int('REPLICA_STICKY_SECONDS', 10)
+# seconds between health checks of the replicas
+REPLICA_HEALTH_INTERVAL = env_int('REPLICA_HEALTH_INTERVAL', 5)
+
+# Number of rows per page of search results
+SEARCH_PAGE_SIZE = 20
+
+# Number of shows per page of the shows listing
+SHOWS_PAGE_SIZE = 30
+
+# Stream listing pages to the client while rows are still being fetched
+STREAM_LISTINGS = False
+
+# Rendered page cache: 'memory' (per worker LRU), 'redis' (shared by all
+# workers, needs the redis package and PAGE_CACHE_URL) or 'null' (disabled).
+# Commands that write (import, schedule, roll-shows, reconcile-shows) can only
+# invalidate the pages of running servers through 'redis'
+PAGE_CACHE_TYPE = os.environ.get('PAGE_CACHE_TYPE', 'memory')
+PAGE_CACHE_URL = os.environ.get('PAGE_CACHE_URL')
+PAGE_CACHE_SIZE = env_int('PAGE_CACHE_SIZE', 1024)
+# seconds a cached page is served before it is rendered again
+PAGE_CACHE_TIMEOUT = env_int('PAGE_CACHE_TIMEOUT', 60)
+
+# Rendered template fragments such as show tiles, cached by the records they
+# show: 'memory' (per worker LRU of FRAGMENT_CACHE_SIZE), 'redis' (one round
+# trip per fragment, at FRAGMENT_CACHE_URL) or 'null' (disabled). Fragments
+# do not expire by default since their keys change with their records.
+FRAGMENT_CACHE_TYPE = os.environ.get('FRAGMENT_CACHE_TYPE', 'memory')
+FRAGMENT_CACHE_URL = os.environ.get('FRAGMENT_CACHE_URL')
+FRAGMENT_CACHE_SIZE = env_int('FRAGMENT_CACHE_SIZE', 10000)
+FRAGMENT_CACHE_TIMEOUT = env_int('FRAGMENT_CACHE_TIMEOUT', 0)
+
+# Number of rows per page of the JSON API, by default and at most
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+
+# Records written per transaction by `flask import`
+IMPORT_BATCH_SIZE = env_int('IMPORT_BATCH_SIZE', 1000)
+
+# Rows fetched from the database per batch by exports
+EXPORT_BATCH_SIZE = env_int('EXPORT_BATCH_SIZE', 1000)
+
+# Log file for the JSON log lines, standard error when unset
+LOG_FILE = os.environ.get('LOG_FILE')
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+
+# Send per-request database, template and total timings in a Server-Timing
+# header; disable when responses are served to untrusted clients
+SERVER_TIMING = env_flag('SERVER_TIMING', True)
+
+# Report queries repeated NPLUSONE_THRESHOLD or more times in one request
+# (N+1 queries) as warnings, or raise NPlusOneError with NPLUSONE_RAISE
+NPLUSONE_DETECT = env_flag('NPLUSONE_DETECT', False)
+NPLUSONE_THRESHOLD = env_int('NPLUSONE_THRESHOLD', 5)
+NPLUSONE_RAISE = env_flag('NPLUSONE_RAISE', False)
+
+# Minutes a show holds its venue and artist; shows of one venue or artist
+# starting closer together are rejected as double bookings by bulk scheduling
+SHOW_LENGTH = env_int('SHOW_LENGTH', 180)
+# Shows accepted per request by POST /api/v1/shows/batch
+SCHEDULE_MAX_SHOWS = env_int('SCHEDULE_MAX_SHOWS', 1000)
+
+# Database of the async read path served by asgi.py, by default DATABASE_URL
+# with its async driver (asyncpg for Postgres, aiosqlite for SQLite)
+ASYNC_DATABASE_URL = os.environ.get('ASYNC_DATABASE_URL')
+# Threads running the Flask views that asgi.py does not serve itself
+ASYNC_WSGI_THREADS = env_int('ASYNC_WSGI_THREADS', 10)
+
+# Compiled templates are written to TEMPLATE_CACHE_DIR, by default a directory
+# of the system temporary directory, and loaded from there by new workers
+# instead of being compiled again; `flask compile-templates` fills it ahead of
+# time
+TEMPLATE_BYTECODE_CACHE = env_flag('TEMPLATE_BYTECODE_CACHE', True)
+TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR')
+# Load every template when a worker starts instead of on its first requests
+PRECOMPILE_TEMPLATES = env_flag('PRECOMPILE_TEMPLATES', False)
@@ -0,0 +1,140 @@
+import io
+import csv
+import json
+from sqlalchemy import select, Integer, Boolean, DateTime
+from models import db, Venue, Artist, Genre, Show, venue_genre, artist_genre
+from queries import isoformat
+
+#----------------------------------------------------------------------------#
+# Bulk export.
+#----------------------------------------------------------------------------#
+# Every table of the catalog can be exported as CSV, JSONL or Parquet. Rows are
+# read through a server-side cursor in batches of EXPORT_BATCH_SIZE and each
+# batch is encoded and handed on before the next is fetched, so memory use does
+# not grow with the size of the table.
+#
+# With since, only venues, artists and shows updated at or after that time
+# (UTC) are exported, together with the genres of the changed venues and
+# artists. Deleted rows are not reported by an incremental export.
+
+def genre_export(table, column, model):
+  statement = select(table.c[column], Genre.name.label('genre')) \
+    .join(Genre, Genre.id == table.c.genre_id) \
+    .order_by(table.c[column], table.c.genre_id)
+  def changed(statement, since):
+    return statement.join(model, model.id == table.c[column]).where(model.updated_at >= since)
+  return statement, changed
+
+def table_export(model):
+  statement = select(model.__table__).order_by(model.id)
+  def changed(statement, since):
+    return statement.where(model.updated_at >= since)
+  return statement, changed
+
+EXPORTS = {
+  'venues': lambda: table_export(Venue),
+  'artists': lambda: table_export(Artist),
+  'shows': lambda: table_export(Show),
+  'venue_genres': lambda: genre_export(venue_genre, 'venue_id', Venue),
+  'artist_genres': lambda: genre_export(artist_genre, 'artist_id', Artist),
+}
+
+MIMETYPES = {
+  'csv': 'text/csv',
+  'jsonl': 'application/x-ndjson',
+  'parquet': 'application/vnd.apache.parquet',
+}
+
+def export_statement(name, since=None):
+  statement, changed = EXPORTS[name]()
+  if since is not None:
+    statement = changed(statement, since)
+  return statement
+
+def export_batches(name, since=None, batch_size=1000):
+  # the selected columns and an iterator over batches of row tuples
+  statement = export_statement(name, since).execution_options(stream_results=True)
+  result = db.session.execute(statement)
+  return statement.selected_columns, result.partitions(batch_size)
+
+#----------------------------------------------------------------------------#
+# Encoders.
+#----------------------------------------------------------------------------#
+# Each encoder turns the batches into an iterator of str or bytes chunks.
+
+def encode_csv(columns, batches):
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  writer.writerow([column.name for column in columns])
+  for batch in batches:
+    writer.writerows(batch)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+  if buffer.tell():
+    yield buffer.getvalue()
+
+def encode_jsonl(columns, batches):
+  names = [column.name for column in columns]
+  for batch in batches:
+    yield ''.join(json.dumps(dict(zip(names, row)), default=isoformat) + '\n' for row in batch)
+
+class ChunkSink(io.RawIOBase):
+    # write-only file handing the bytes written so far to the caller, while
+    # reporting the total position the Parquet writer records offsets from
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def encode_parquet(columns, batches):
+  # one row group per batch; the optional dependency is imported before the
+  # first chunk so a missing package fails the export up front
+  import pyarrow
+  import pyarrow.parquet
+
+  def arrow_type(column):
+    if isinstance(column.type, Boolean):
+      return pyarrow.bool_()
+    if isinstance(column.type, Integer):
+      return pyarrow.int64()
+    if isinstance(column.type, DateTime):
+      return pyarrow.timestamp('us')
+    return pyarrow.string()
+
+  schema = pyarrow.schema([(column.name, arrow_type(column)) for column in columns])
+  def chunks():
+    sink = ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    for batch in batches:
+      writer.write_batch(pyarrow.record_batch(list(zip(*batch)), schema=schema))
+      yield sink.drain()
+    writer.close()
+    yield sink.drain()
+  return chunks()
+
+ENCODERS = {
+  'csv': encode_csv,
+  'jsonl': encode_jsonl,
+  'parquet': encode_parquet,
+}
+
+def export_chunks(name, format, since=None, batch_size=1000):
+  columns, batches = export_batches(name, since, batch_size)
+  return ENCODERS[format](columns, batches)
@@ -1,18 +1,36 @@
-from fabric.api import local, settings, abort
+import os
+from fabric.api import local, settings, abort, warn
 from fabric.contrib.console import confirm
 
 # prepare for deployment
 
 
+BASELINE = 'benchmark_baseline.json'
+
+
 def test():
+    with settings(warn_only=True):
+        result = local("python -m pytest")
+    if result.failed and not confirm("Tests failed. Continue?"):
+        abort("Aborted at user request.")
+
+    # timings are only comparable on the machine that recorded them, so a
+    # fresh checkout has no baseline until `fab baseline` records one
+    if not os.path.exists(BASELINE):
+        warn("No {} found, skipping the benchmark comparison. Run `fab baseline` to record one.".format(BASELINE))
+        return
     with settings(warn_only=True):
         result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
+            "FLASK_APP=app.py flask benchmark --compare {}".format(BASELINE), capture=True
         )
-    if result.failed and not confirm("Tests failed. Continue?"):
+    if result.failed and not confirm("Benchmarks regressed. Continue?"):
         abort("Aborted at user request.")
 
 
+def baseline():
+    local("FLASK_APP=app.py flask benchmark --save {}".format(BASELINE))
+
+
 def commit():
     message = raw_input("Enter a git commit message: ")
     local("git add . && git commit -am '{}'".format(message))
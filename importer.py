@@ -0,0 +1,239 @@
+import os
+import csv
+import json
+import time
+from werkzeug.datastructures import MultiDict
+from wtforms import BooleanField
+from sqlalchemy import text
+from forms import VenueForm, ArtistForm, ShowForm
+from models import db, Venue, Artist, Show, venue_genre, artist_genre
+from queries import load_genres, refresh_show_counters
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+# Venues, artists and shows are streamed from CSV or JSONL files, validated
+# with the forms behind the create pages and written in batches. Each batch is
+# one transaction of multi-row INSERTs; once it commits, a checkpoint records
+# how many records of the file are done, so an interrupted import resumes
+# after the last committed batch instead of starting over.
+#
+# CSV columns are the form field names; genres are separated by ';'. JSONL
+# records use the same names, with genres as a list or a ';' separated string.
+
+KINDS = {
+  'venues': {
+    'form': VenueForm,
+    'model': Venue,
+    'genre_table': venue_genre,
+    'genre_column': 'venue_id',
+    'columns': ('name', 'city', 'state', 'address', 'phone', 'website_link', 'facebook_link',
+                'image_link', 'seeking_talent', 'seeking_description'),
+    'tags': ('venues',),
+  },
+  'artists': {
+    'form': ArtistForm,
+    'model': Artist,
+    'genre_table': artist_genre,
+    'genre_column': 'artist_id',
+    'columns': ('name', 'city', 'state', 'phone', 'website_link', 'facebook_link',
+                'image_link', 'seeking_venue', 'seeking_description'),
+    'tags': ('artists',),
+  },
+  'shows': {
+    'form': ShowForm,
+    'model': Show,
+    'columns': ('venue_id', 'artist_id', 'start_time'),
+    'tags': ('shows', 'venues'),
+  },
+}
+
+def read_records(path, format=None):
+  # (number, record) pairs; records that cannot be parsed are None
+  format = format or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+  with open(path, newline='', encoding='utf-8') as file:
+    if format == 'csv':
+      for number, record in enumerate(csv.DictReader(file), 1):
+        yield number, record
+      return
+    number = 0
+    for line in file:
+      if not line.strip():
+        continue
+      number += 1
+      try:
+        record = json.loads(line)
+      except ValueError:
+        record = None
+      yield number, record if isinstance(record, dict) else None
+
+def form_data(record, booleans):
+  # the record as submitted form data, so the form's own rules apply
+  data = MultiDict()
+  for key, value in record.items():
+    if key == 'genres' and isinstance(value, str):
+      value = [genre.strip() for genre in value.split(';') if genre.strip()]
+    if key in booleans:
+      if value not in (None, False) and str(value).strip().lower() not in ('', '0', 'n', 'no', 'false', 'off'):
+        data[key] = 'y'
+    elif isinstance(value, list):
+      data.setlist(key, [str(item) for item in value])
+    elif value is not None:
+      data[key] = str(value)
+  return data
+
+def validated_row(spec, form, booleans, record):
+  # the table row for a record, or the errors that reject it
+  if record is None:
+    return None, {'record': ['Not a JSON object.']}
+  form.process(form_data(record, booleans))
+  if not form.validate():
+    return None, form.errors
+  row = {name: form[name].data for name in spec['columns']}
+  if 'genre_table' in spec:
+    row['genres'] = list(dict.fromkeys(form.genres.data))
+    return row, None
+  errors = {}
+  for name in ('venue_id', 'artist_id'):
+    try:
+      row[name] = int(row[name])
+    except (TypeError, ValueError):
+      errors[name] = ['Not an id.']
+  return (None, errors) if errors else (row, None)
+
+def reserve_ids(model, count):
+  # primary keys for a batch of new rows, so their genre rows can be written
+  # without reading back each generated key
+  if db.engine.dialect.name == 'postgresql':
+    statement = text(
+      "SELECT nextval(pg_get_serial_sequence('\"{}\"', 'id')) FROM generate_series(1, :count)"
+      .format(model.__tablename__)
+    )
+    return [row[0] for row in db.session.execute(statement, {'count': count})]
+  # SQLite assigns max(id) + 1 itself; a concurrent writer taking the same
+  # ids fails the batch on the primary key and the import can be resumed
+  start = db.session.query(db.func.coalesce(db.func.max(model.id), 0)).scalar()
+  return list(range(start + 1, start + count + 1))
+
+def missing_references(rows):
+  # row numbers of shows whose venue or artist does not exist, checked with
+  # one query per table for the whole batch
+  venue_ids = {row['venue_id'] for number, row in rows}
+  artist_ids = {row['artist_id'] for number, row in rows}
+  venues = {id for id, in db.session.query(Venue.id).filter(Venue.id.in_(venue_ids))}
+  artists = {id for id, in db.session.query(Artist.id).filter(Artist.id.in_(artist_ids))}
+  missing = {}
+  for number, row in rows:
+    errors = {}
+    if row['venue_id'] not in venues:
+      errors['venue_id'] = ['No venue with this id.']
+    if row['artist_id'] not in artists:
+      errors['artist_id'] = ['No artist with this id.']
+    if errors:
+      missing[number] = errors
+  return missing
+
+def write_batch(kind, rows, genre_ids):
+  # insert one batch of validated rows and return the page cache tags it changes
+  spec = KINDS[kind]
+  model = spec['model']
+  tags = set(spec['tags'])
+  if kind == 'shows':
+    db.session.execute(model.__table__.insert(), [row for number, row in rows])
+    venue_ids = {row['venue_id'] for number, row in rows}
+    artist_ids = {row['artist_id'] for number, row in rows}
+    refresh_show_counters(Venue, Show.venue_id, Venue.id.in_(venue_ids))
+    refresh_show_counters(Artist, Show.artist_id, Artist.id.in_(artist_ids))
+    tags.update('venue:{}'.format(id) for id in venue_ids)
+    tags.update('artist:{}'.format(id) for id in artist_ids)
+    return tags
+
+  genres = []
+  for id, (number, row) in zip(reserve_ids(model, len(rows)), rows):
+    row['id'] = id
+    genres.extend({spec['genre_column']: id, 'genre_id': genre_ids[name]} for name in row.pop('genres'))
+  db.session.execute(model.__table__.insert(), [row for number, row in rows])
+  if genres:
+    db.session.execute(spec['genre_table'].insert(), genres)
+  return tags
+
+def read_checkpoint(path):
+  if not path or not os.path.exists(path):
+    return 0
+  with open(path) as file:
+    return json.load(file)['done']
+
+def write_checkpoint(path, done):
+  # written to a temporary file and renamed, so a crash never leaves it torn
+  if not path:
+    return
+  with open(path + '.tmp', 'w') as file:
+    json.dump({'done': done}, file)
+  os.replace(path + '.tmp', path)
+
+def import_file(kind, path, format=None, batch_size=1000, checkpoint=None, rejects=None, progress=None, invalidate=None):
+  # import every record of path after the checkpoint; progress receives the
+  # running totals after each batch and invalidate the page cache tags of
+  # each committed batch
+  spec = KINDS[kind]
+  form = spec['form'](meta={'csrf': False})
+  booleans = {name for name, field in form._fields.items() if isinstance(field, BooleanField)}
+  genre_ids = load_genres() if 'genre_table' in spec else None
+
+  done = read_checkpoint(checkpoint)
+  totals = {'read': done, 'resumed': done, 'imported': 0, 'rejected': 0, 'started': time.monotonic()}
+  rejected = open(rejects, 'a', encoding='utf-8') if rejects else None
+  # rejects are written once their batch commits, so records of a batch that
+  # fails and is imported again on resume are not reported twice
+  pending = []
+
+  def reject(number, record, errors):
+    pending.append({'record': number, 'errors': errors, 'data': record})
+
+  def flush(rows, last):
+    if kind == 'shows' and rows:
+      missing = missing_references(rows)
+      for number, row in rows:
+        if number in missing:
+          reject(number, row, missing[number])
+      rows = [(number, row) for number, row in rows if number not in missing]
+    tags = write_batch(kind, rows, genre_ids) if rows else set()
+    db.session.commit()
+    write_checkpoint(checkpoint, last)
+    totals['rejected'] += len(pending)
+    if rejected:
+      for entry in pending:
+        rejected.write(json.dumps(entry, default=str) + '\n')
+    pending.clear()
+    if invalidate and tags:
+      invalidate(*tags)
+    totals['imported'] += len(rows)
+    if progress:
+      progress(totals)
+
+  try:
+    batch = []
+    for number, record in read_records(path, format):
+      if number <= done:
+        continue
+      totals['read'] = number
+      row, errors = validated_row(spec, form, booleans, record)
+      if errors:
+        reject(number, record, errors)
+      else:
+        batch.append((number, row))
+      if number - done >= batch_size:
+        flush(batch, number)
+        batch, done = [], number
+    if totals['read'] > done:
+      flush(batch, totals['read'])
+  except Exception:
+    db.session.rollback()
+    raise
+  finally:
+    if rejected:
+      rejected.close()
+
+  if checkpoint and os.path.exists(checkpoint):
+    os.remove(checkpoint)
+  return totals
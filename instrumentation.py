@@ -0,0 +1,292 @@
+import re
+import json
+import time
+import logging
+import threading
+from bisect import bisect_left
+from functools import lru_cache
+from flask import request, g, has_app_context
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+#----------------------------------------------------------------------------#
+# Request timing.
+#----------------------------------------------------------------------------#
+# Each request records its wall time, the number and total time of the SQL
+# statements it executes and the time spent rendering templates. The timings
+# are sent back in a Server-Timing header, written to the log as one JSON line
+# per request and aggregated per route for the Prometheus /metrics endpoint.
+# Metrics are kept per worker process; Prometheus sums them across workers.
+
+# upper bounds, in seconds, of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def current_timing():
+  # the timing of the request being handled, if any
+  return g.get('timing') if has_app_context() else None
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_statement(connection, cursor, statement, parameters, context, executemany):
+  connection.info.setdefault('statement_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def end_statement(connection, cursor, statement, parameters, context, executemany):
+  elapsed = time.perf_counter() - connection.info['statement_started'].pop()
+  timing = current_timing()
+  if timing is not None:
+    timing['sql_count'] += 1
+    timing['sql'] += elapsed
+    if 'queries' in timing:
+      record_query(timing, statement)
+
+@event.listens_for(Engine, 'handle_error')
+def fail_statement(context):
+  started = context.connection.info.get('statement_started') if context.connection else None
+  if started:
+    started.pop()
+
+class TimedTemplate(Template):
+    # includes and inherited layouts render inside the outermost template, so
+    # only whole renders are timed
+
+    def render(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            timing = current_timing()
+            if timing is not None:
+                timing['render'] += time.perf_counter() - started
+
+class JsonFormatter(logging.Formatter):
+    # one JSON object per line; fields passed with extra={'fields': {...}} are
+    # merged into it
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+#----------------------------------------------------------------------------#
+# N+1 detection.
+#----------------------------------------------------------------------------#
+# With NPLUSONE_DETECT, every statement of a request is reduced to its shape
+# (literals, parameters and IN lists replaced by placeholders). A shape run
+# NPLUSONE_THRESHOLD times or more in one request is reported with the view
+# and the relationships whose lazy loads issued it; NPLUSONE_RAISE turns the
+# warning into an NPlusOneError for test runs.
+
+class NPlusOneError(Exception):
+    pass
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+PARAMETERS = re.compile(r"%\(\w+\)s|%s|\?")
+IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+
+@lru_cache(maxsize=1024)
+def fingerprint(statement):
+  # the shape of a statement, shared by every execution that differs only
+  # in the values it is run with
+  statement = PARAMETERS.sub('?', LITERALS.sub('?', statement))
+  return ' '.join(IN_LISTS.sub('(?)', statement).split())
+
+@event.listens_for(Session, 'do_orm_execute')
+def note_relationship_load(orm_execute_state):
+  # remember which relationship a lazy load is for until its statement runs
+  timing = current_timing()
+  if timing is not None and 'queries' in timing and orm_execute_state.is_relationship_load:
+    timing['relationship'] = str(orm_execute_state.loader_strategy_path[-1])
+
+def record_query(timing, statement):
+  shape = fingerprint(statement)
+  query = timing['queries'].get(shape)
+  if query is None:
+    query = timing['queries'][shape] = {'count': 0, 'relationships': set(), 'statement': statement}
+  query['count'] += 1
+  relationship = timing.pop('relationship', None)
+  if relationship:
+    query['relationships'].add(relationship)
+
+#----------------------------------------------------------------------------#
+# Metrics.
+#----------------------------------------------------------------------------#
+
+class Metrics:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.latency = {}
+        self.sql_count = {}
+        self.sql_seconds = {}
+        self.render_seconds = {}
+        # (name, kind, help, label, read) of counters kept by other extensions
+        self.sources = []
+
+    def register(self, name, kind, help, label, read):
+        # read returns a dict of label value -> current value
+        self.sources.append((name, kind, help, label, read))
+
+    def observe(self, method, route, status, timing, elapsed):
+        key = (method, route)
+        with self.lock:
+            self.requests[key + (status,)] = self.requests.get(key + (status,), 0) + 1
+            buckets, total = self.latency.get(key, ([0] * (len(LATENCY_BUCKETS) + 1), 0.0))
+            buckets[bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+            self.latency[key] = (buckets, total + elapsed)
+            self.sql_count[key] = self.sql_count.get(key, 0) + timing['sql_count']
+            self.sql_seconds[key] = self.sql_seconds.get(key, 0.0) + timing['sql']
+            self.render_seconds[key] = self.render_seconds.get(key, 0.0) + timing['render']
+
+    def render(self):
+        # the Prometheus text exposition format
+        def labels(**values):
+            return '{' + ','.join(
+                '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                for name, value in values.items()
+            ) + '}'
+
+        lines = []
+        with self.lock:
+            lines.append('# HELP fyyur_requests_total Requests handled, by route and status.')
+            lines.append('# TYPE fyyur_requests_total counter')
+            for (method, route, status), count in sorted(self.requests.items()):
+                lines.append('fyyur_requests_total{} {}'.format(labels(method=method, route=route, status=status), count))
+
+            lines.append('# HELP fyyur_request_duration_seconds Request wall time, by route.')
+            lines.append('# TYPE fyyur_request_duration_seconds histogram')
+            for (method, route), (buckets, total) in sorted(self.latency.items()):
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+                    cumulative += count
+                    lines.append('fyyur_request_duration_seconds_bucket{} {}'.format(
+                        labels(method=method, route=route, le=bound), cumulative))
+                lines.append('fyyur_request_duration_seconds_sum{} {}'.format(labels(method=method, route=route), total))
+                lines.append('fyyur_request_duration_seconds_count{} {}'.format(labels(method=method, route=route), cumulative))
+
+            for name, kind, help, values in (
+                ('fyyur_sql_statements_total', 'counter', 'SQL statements executed, by route.', self.sql_count),
+                ('fyyur_sql_seconds_total', 'counter', 'Time spent executing SQL, by route.', self.sql_seconds),
+                ('fyyur_template_render_seconds_total', 'counter', 'Time spent rendering templates, by route.', self.render_seconds),
+            ):
+                lines.append('# HELP {} {}'.format(name, help))
+                lines.append('# TYPE {} {}'.format(name, kind))
+                for (method, route), value in sorted(values.items()):
+                    lines.append('{}{} {}'.format(name, labels(method=method, route=route), value))
+
+        for name, kind, help, label, read in self.sources:
+            lines.append('# HELP {} {}'.format(name, help))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for value_label, value in sorted(read().items()):
+                lines.append('{}{} {}'.format(name, labels(**{label: value_label}), value))
+        return '\n'.join(lines) + '\n'
+
+#----------------------------------------------------------------------------#
+# Extension.
+#----------------------------------------------------------------------------#
+
+class Instrumentation:
+
+    def __init__(self, app=None):
+        self.metrics = Metrics()
+        # route -> repeated query shapes found on it, for nplusone_report()
+        self.repeated = {}
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.jinja_env.template_class = TimedTemplate
+        app.before_request(self.start_request)
+        app.after_request(self.end_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    def start_request(self):
+        g.timing = {'started': time.perf_counter(), 'sql_count': 0, 'sql': 0.0, 'render': 0.0}
+        if self.app.config.get('NPLUSONE_DETECT'):
+            g.timing['queries'] = {}
+
+    def end_request(self, response):
+        timing = g.pop('timing', None)
+        if timing is None:
+            return response
+        elapsed = time.perf_counter() - timing['started']
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        if route != '/metrics':
+            self.metrics.observe(request.method, route, response.status_code, timing, elapsed)
+
+        # streamed responses report the time taken until their first byte
+        if self.app.config.get('SERVER_TIMING', True):
+            response.headers['Server-Timing'] = ', '.join([
+                'db;dur={:.1f};desc="{} queries"'.format(timing['sql'] * 1000, timing['sql_count']),
+                'render;dur={:.1f}'.format(timing['render'] * 1000),
+                'total;dur={:.1f}'.format(elapsed * 1000),
+            ])
+
+        self.app.logger.info('request', extra={'fields': {
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'route': route,
+            'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 1),
+            'sql_count': timing['sql_count'],
+            'sql_ms': round(timing['sql'] * 1000, 1),
+            'render_ms': round(timing['render'] * 1000, 1),
+        }})
+
+        if 'queries' in timing:
+            self.check_repeated(route, timing['queries'])
+        return response
+
+    def check_repeated(self, route, queries):
+        threshold = self.app.config.get('NPLUSONE_THRESHOLD', 5)
+        repeated = [query for query in queries.values() if query['count'] >= threshold]
+        if not repeated:
+            return
+
+        with self.lock:
+            found = self.repeated.setdefault(route, {'view': request.endpoint, 'requests': 0, 'queries': {}})
+            found['requests'] += 1
+            for query in repeated:
+                shape = fingerprint(query['statement'])
+                worst = found['queries'].setdefault(shape, {'count': 0, 'relationships': set()})
+                worst['count'] = max(worst['count'], query['count'])
+                worst['relationships'].update(query['relationships'])
+
+        for query in repeated:
+            self.app.logger.warning('N+1 query', extra={'fields': {
+                'route': route,
+                'view': request.endpoint,
+                'count': query['count'],
+                'relationships': sorted(query['relationships']),
+                'statement': ' '.join(query['statement'].split()),
+            }})
+        if self.app.config.get('NPLUSONE_RAISE'):
+            query = max(repeated, key=lambda query: query['count'])
+            raise NPlusOneError('{} ran the same query {} times{}: {}'.format(
+                request.endpoint, query['count'],
+                ' via ' + ', '.join(sorted(query['relationships'])) if query['relationships'] else '',
+                ' '.join(query['statement'].split())
+            ))
+
+    def nplusone_report(self):
+        # routes with repeated queries, worst first
+        with self.lock:
+            report = [
+                dict(found, route=route, worst=max(query['count'] for query in found['queries'].values()))
+                for route, found in self.repeated.items()
+            ]
+        return sorted(report, key=lambda found: found['worst'], reverse=True)
+
+    def metrics_view(self):
+        return self.app.response_class(self.metrics.render(), mimetype='text/plain; version=0.0.4')
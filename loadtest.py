@@ -0,0 +1,226 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import secrets
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit, urlencode
+from benchmark import percentile
+
+#----------------------------------------------------------------------------#
+# Load test.
+#----------------------------------------------------------------------------#
+# Virtual users run concurrently against a running server, each repeatedly
+# picking a scenario by weight and performing its steps over one keep-alive
+# connection with its own session cookie. While they run, /pool is sampled to
+# follow the database connection pool of the server. The report gives the
+# throughput, latency distribution and error rate of the whole run and of
+# every step, and the peak pool usage.
+
+SEARCH_TERMS = ('a', 'an', 'the', 'band', 'hall', 'jazz', 'rock', 'san', 'new york', 'club')
+
+def browse(user):
+  user.get('/venues')
+  user.get('/venues/{}'.format(user.choice('venues')))
+  user.get('/artists/{}'.format(user.choice('artists')))
+
+def search(user):
+  user.post('/venues/search', {'search_term': user.rng.choice(SEARCH_TERMS)})
+  user.post('/artists/search', {'search_term': user.rng.choice(SEARCH_TERMS)})
+
+def list_shows(user):
+  user.get('/shows')
+
+def create_show(user):
+  # the form page sets the session cookie and CSRF token the post needs
+  page = user.get('/shows/create')
+  token = re.search(r'name="csrf_token" type="hidden" value="([^"]*)"', page)
+  user.post('/shows/create', {
+    'csrf_token': token.group(1) if token else '',
+    'venue_id': user.choice('venues'),
+    'artist_id': user.choice('artists'),
+    'start_time': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time() + user.rng.randint(1, 365) * 86400)),
+  })
+
+SCENARIOS = {
+  'browse': (browse, 50),
+  'search': (search, 25),
+  'shows': (list_shows, 15),
+  'create': (create_show, 10),
+}
+
+def summary(samples, elapsed):
+  # samples are (latency, ok) pairs
+  latencies = sorted(latency for latency, ok in samples)
+  errors = sum(1 for latency, ok in samples if not ok)
+  def ms(value):
+    return round(value * 1000, 2) if value is not None else None
+  return {
+    'requests': len(samples),
+    'throughput': round(len(samples) / elapsed, 1) if elapsed else 0,
+    'error_rate': round(errors / len(samples), 4) if samples else 0,
+    'latency_ms': {
+      'p50': ms(percentile(latencies, 0.50)),
+      'p90': ms(percentile(latencies, 0.90)),
+      'p95': ms(percentile(latencies, 0.95)),
+      'p99': ms(percentile(latencies, 0.99)),
+      'max': ms(latencies[-1] if latencies else None),
+    },
+  }
+
+class VirtualUser:
+
+    def __init__(self, url, ids, seed, record):
+        parts = urlsplit(url)
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        self.ids = ids
+        self.rng = random.Random(seed)
+        self.record = record
+        self.cookie = None
+
+    def choice(self, kind):
+        return self.rng.choice(self.ids[kind]) if self.ids[kind] else 1
+
+    def request(self, method, path, form=None):
+        headers = {'Cookie': self.cookie} if self.cookie else {}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        started = time.perf_counter()
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+            ok = response.status < 400
+            cookie = response.getheader('Set-Cookie')
+            if cookie:
+                self.cookie = cookie.split(';', 1)[0]
+        except (OSError, http.client.HTTPException):
+            # drop the broken connection; the next request reconnects
+            self.connection.close()
+            data, ok = b'', False
+        self.record('{} {}'.format(method, re.sub(r'/\d+', '/<id>', path)), time.perf_counter() - started, ok)
+        return data.decode('utf-8', 'replace')
+
+    def get(self, path):
+        return self.request('GET', path)
+
+    def post(self, path, form):
+        return self.request('POST', path, form)
+
+def fetch_json(url, path):
+  parts = urlsplit(url)
+  connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=10)
+  try:
+    connection.request('GET', path)
+    response = connection.getresponse()
+    return json.loads(response.read()) if response.status == 200 else None
+  finally:
+    connection.close()
+
+def discover_ids(url, limit=500):
+  # ids of existing venues and artists, for the detail pages and new shows
+  ids = {}
+  for kind in ('venues', 'artists'):
+    page = fetch_json(url, '/api/v1/{}?fields=id&limit={}'.format(kind, limit)) or {'data': []}
+    ids[kind] = [row['id'] for row in page['data']]
+  return ids
+
+def sample_pool(url, stop, samples, interval=0.5):
+  while not stop.wait(interval):
+    try:
+      stats = fetch_json(url, '/pool')
+    except (OSError, ValueError, http.client.HTTPException):
+      stats = None
+    if stats and 'checkedout' in stats:
+      samples.append(stats)
+
+def pool_summary(samples):
+  if not samples:
+    return None
+  size = max(sample.get('size', 0) for sample in samples)
+  checked_out = [sample['checkedout'] for sample in samples]
+  return {
+    'samples': len(samples),
+    'size': size,
+    'max_checked_out': max(checked_out),
+    'max_overflow': max(sample.get('overflow', 0) for sample in samples),
+    # share of samples with every pooled connection in use
+    'saturated': round(sum(1 for count in checked_out if size and count >= size) / len(samples), 4),
+  }
+
+def run(url, workers=8, duration=30, scenarios=SCENARIOS, weights=None, seed=0):
+  weights = weights or {name: weight for name, (step, weight) in scenarios.items()}
+  names = [name for name in scenarios if weights.get(name)]
+  ids = discover_ids(url)
+
+  lock = threading.Lock()
+  samples = {}
+  def record(step, latency, ok):
+    with lock:
+      samples.setdefault(step, []).append((latency, ok))
+
+  stop = threading.Event()
+  def user(number):
+    rng = random.Random(seed + number)
+    client = VirtualUser(url, ids, seed + number, record)
+    while not stop.is_set():
+      scenarios[rng.choices(names, [weights[name] for name in names])[0]][0](client)
+    client.connection.close()
+
+  pool_samples = []
+  threads = [threading.Thread(target=user, args=(number,), daemon=True) for number in range(workers)]
+  threads.append(threading.Thread(target=sample_pool, args=(url, stop, pool_samples), daemon=True))
+  started = time.perf_counter()
+  for thread in threads:
+    thread.start()
+  time.sleep(duration)
+  stop.set()
+  for thread in threads:
+    thread.join()
+  elapsed = time.perf_counter() - started
+
+  everything = [sample for step in samples.values() for sample in step]
+  return {
+    'url': url,
+    'workers': workers,
+    'duration': round(elapsed, 2),
+    'weights': {name: weights[name] for name in names},
+    'total': summary(everything, elapsed),
+    'steps': {step: summary(step_samples, elapsed) for step, step_samples in sorted(samples.items())},
+    'pool': pool_summary(pool_samples),
+  }
+
+#----------------------------------------------------------------------------#
+# Local server.
+#----------------------------------------------------------------------------#
+
+def start_server(port, workers=1):
+  # gunicorn with the given worker processes, or the threaded development
+  # server for a single worker; the workers share one SECRET_KEY so sessions
+  # and CSRF tokens are valid on all of them
+  env = dict(os.environ, FLASK_APP='app.py')
+  env.setdefault('SECRET_KEY', secrets.token_hex(32))
+  if workers > 1:
+    command = [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--bind', '127.0.0.1:{}'.format(port), 'app:app']
+  else:
+    command = [sys.executable, '-m', 'flask', 'run', '--port', str(port), '--with-threads', '--no-reload']
+  server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+  url = 'http://127.0.0.1:{}'.format(port)
+  deadline = time.monotonic() + 30
+  while time.monotonic() < deadline:
+    if server.poll() is not None:
+      raise RuntimeError('the server exited with status {}'.format(server.returncode))
+    try:
+      fetch_json(url, '/pool')
+      return server, url
+    except (OSError, http.client.HTTPException):
+      time.sleep(0.2)
+  server.terminate()
+  raise RuntimeError('the server did not start within 30 seconds')
@@ -0,0 +1,47 @@
+"""add search indexes
+
+Revision ID: 5c3b9f2e7a14
+Revises: a157cfd53d18
+Create Date: 2026-10-17 09:12:41.530211
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from search import SEARCHABLE, search_table, sqlite_search_ddl, sqlite_search_backfill
+
+
+# revision identifiers, used by Alembic.
+revision = '5c3b9f2e7a14'
+down_revision = 'a157cfd53d18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table in SEARCHABLE:
+            for column in ('name', 'city'):
+                op.create_index('ix_{}_{}_trgm'.format(table, column), table, [column],
+                    postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+    elif dialect == 'sqlite':
+        for table, genre_table in SEARCHABLE.items():
+            for statement in sqlite_search_ddl(table, genre_table):
+                op.execute(statement)
+            op.execute(sqlite_search_backfill(table, genre_table))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for table in SEARCHABLE:
+            for column in ('name', 'city'):
+                op.drop_index('ix_{}_{}_trgm'.format(table, column), table_name=table)
+    elif dialect == 'sqlite':
+        for table in SEARCHABLE:
+            fts = search_table(table)
+            for trigger in ('insert', 'update', 'delete', 'genre_insert', 'genre_delete'):
+                op.execute('DROP TRIGGER IF EXISTS {}_{}'.format(fts, trigger))
+            op.execute('DROP TABLE IF EXISTS {}'.format(fts))
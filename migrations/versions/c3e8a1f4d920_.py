@@ -0,0 +1,35 @@
+"""index name, city and state together for search
+
+Revision ID: c3e8a1f4d920
+Revises: 0a6e93d2b5c1
+Create Date: 2026-10-17 18:41:05.118402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from search import SEARCHABLE, postgres_search_index
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e8a1f4d920'
+down_revision = '0a6e93d2b5c1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for table in SEARCHABLE:
+            op.execute(postgres_search_index(sa.table(table, sa.column('name'), sa.column('city'), sa.column('state'))))
+            for column in ('name', 'city'):
+                op.drop_index('ix_{}_{}_trgm'.format(table, column), table_name=table)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for table in SEARCHABLE:
+            for column in ('name', 'city'):
+                op.create_index('ix_{}_{}_trgm'.format(table, column), table, [column],
+                    postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+            op.drop_index('ix_{}_search_trgm'.format(table), table_name=table)
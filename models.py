@@ -0,0 +1,164 @@
+import sqlite3
+from datetime import datetime
+from sqlalchemy.orm import relationship
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from search import register_search_ddl
+from routing import RoutingSQLAlchemy
+
+# sessions route the reads of GET requests to the replicas, see routing.py
+db = RoutingSQLAlchemy()
+
+#----------------------------------------------------------------------------#
+# Models.
+#----------------------------------------------------------------------------#
+
+artist_genre = db.Table('artist_genre',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_artist_genre_genre_id', 'genre_id')
+)
+
+venue_genre = db.Table('venue_genre',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_venue_genre_genre_id', 'genre_id')
+)
+
+class Venue(db.Model):
+    __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_Venue_state_city', 'state', 'city'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String)
+    genres = relationship("Genre", secondary=venue_genre)
+    address = db.Column(db.String(120))
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    phone = db.Column(db.String(120))
+    website_link = db.Column(db.String(120))
+    facebook_link = db.Column(db.String(120))
+    seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
+    seeking_description = db.Column(db.String(120))    
+    image_link = db.Column(db.String(500))
+
+    # show counters maintained by refresh_show_counters()
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_time = db.Column(db.DateTime, index=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=db.func.now(), index=True)
+
+class Artist(db.Model):
+    __tablename__ = 'Artist'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String)
+    genres = relationship("Genre", secondary=artist_genre)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    phone = db.Column(db.String(120))
+    website_link = db.Column(db.String(120))
+    facebook_link = db.Column(db.String(120))
+    seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
+    seeking_description = db.Column(db.String(120))
+    image_link = db.Column(db.String(500))
+
+    # show counters maintained by refresh_show_counters()
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_time = db.Column(db.DateTime, index=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=db.func.now(), index=True)
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+    __table_args__ = (
+        db.UniqueConstraint('name', name='uq_Genre_name'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String)
+
+class Show(db.Model):
+    __tablename__ = 'Show'
+
+    id = db.Column('id', db.Integer, primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=db.func.now(), index=True)
+
+    # shows are removed by the database's ON DELETE CASCADE when their venue or
+    # artist is deleted, so the ORM never loads or nulls them out
+    venue = db.relationship(Venue, backref=db.backref("shows", cascade="all, delete-orphan", passive_deletes=True))
+    artist = db.relationship(Artist, backref=db.backref("shows", cascade="all, delete-orphan", passive_deletes=True))
+
+    __table_args__ = (
+        db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+    )
+
+class TableVersion(db.Model):
+    __tablename__ = 'TableVersion'
+
+    # one row per table in VERSIONED_TABLES, bumped by every transaction that
+    # writes to the table, deletes included
+    name = db.Column(db.String(32), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, server_default=db.func.now())
+
+register_search_ddl(db.metadata)
+
+#----------------------------------------------------------------------------#
+# Table versions.
+#----------------------------------------------------------------------------#
+# The listing pages are validated by the versions of the tables they show, a
+# primary key lookup, instead of aggregating the tables on every request. The
+# tables written by a transaction, through flushes or statements run on the
+# session, are collected as it goes and bumped together just before it
+# commits: the version rows are locked only for the commit, always in the same
+# order, so concurrent writers queue on them briefly and never deadlock.
+
+VERSIONED_TABLES = ('Artist', 'Show', 'Venue')
+
+@event.listens_for(TableVersion.__table__, 'after_create')
+def add_table_versions(target, connection, **kw):
+  connection.execute(target.insert(), [{'name': name} for name in VERSIONED_TABLES])
+
+def note_changes(session, names):
+  session.info.setdefault('changed_tables', set()).update(name for name in names if name in VERSIONED_TABLES)
+
+@event.listens_for(db.session, 'after_flush')
+def note_flushed_changes(session, flush_context):
+  changed = set(session.new) | set(session.deleted) | {instance for instance in session.dirty if session.is_modified(instance)}
+  note_changes(session, {instance.__table__.name for instance in changed})
+
+@event.listens_for(db.session, 'do_orm_execute')
+def note_executed_changes(orm_execute_state):
+  if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+    note_changes(orm_execute_state.session, [orm_execute_state.statement.table.name])
+
+@event.listens_for(db.session, 'before_commit')
+def bump_table_versions(session):
+  # flush first: the commit flushes only after this hook
+  session.flush()
+  for name in sorted(session.info.pop('changed_tables', ())):
+    session.execute(db.update(TableVersion).where(TableVersion.name == name).values(
+      version=TableVersion.version + 1, changed_at=datetime.utcnow()))
+
+@event.listens_for(db.session, 'after_transaction_end')
+def forget_changes(session, transaction):
+  # changes rolled back or closed without a commit
+  if transaction.parent is None:
+    session.info.pop('changed_tables', None)
+
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+  # SQLite only enforces foreign keys, and so ON DELETE CASCADE, when asked to
+  if isinstance(dbapi_connection, sqlite3.Connection):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
@@ -0,0 +1,240 @@
+import json
+import base64
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import select, func, and_, or_, false
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Venue, Artist, Genre, Show, venue_genre, artist_genre
+from search import search_condition, search_rank
+from forms import Genres
+
+#----------------------------------------------------------------------------#
+# Read queries.
+#----------------------------------------------------------------------------#
+# Queries shared by the HTML views, the JSON API and the async read path. They
+# select columns rather than entities, so callers receive plain result tuples
+# and no ORM objects are built on the read path. Statements are built apart
+# from the session that runs them, so the async engine can run the same ones.
+
+def isoformat(value):
+  # json default for the dates and times of rows, shared by the API and the
+  # exports
+  if hasattr(value, 'isoformat'):
+    return value.isoformat()
+  raise TypeError('{!r} is not JSON serializable'.format(value))
+
+def encode_cursor(*values):
+  # opaque keyset cursor for paginated listings
+  return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor):
+  if not cursor:
+    return None
+  try:
+    return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+  except (ValueError, TypeError):
+    return None
+
+def search_position(cursor):
+  # the (rank, name, id) a search cursor continues after, or None for a
+  # malformed one: cursors are opaque to clients but not tamper-proof, and
+  # those issued before ranked search held (name, id)
+  position = decode_cursor(cursor)
+  if isinstance(position, list) and [type(value) for value in position] == [int, str, int]:
+    return position
+  return None
+
+def search_statement(model, term, dialect, cursor=None, limit=20):
+  # one page of ranked matches for model together with the total match count
+  # and the upcoming show count of each row, all from a single query; one row
+  # past limit is selected to tell whether another page follows
+  # the window count is taken over the whole match set before the keyset
+  # filter is applied, so every page reports the total number of results
+  matches = select(
+    model.id,
+    model.name,
+    model.upcoming_shows_count.label('num_upcoming_shows'),
+    search_rank(model, term).label('rank'),
+    func.count().over().label('count')
+  ).where(search_condition(model, term, dialect)).subquery()
+
+  statement = select(matches)
+  if cursor:
+    position = search_position(cursor)
+    if position is None:
+      return statement.where(false()).limit(limit + 1)
+    rank, name, id = position
+    statement = statement.where(or_(
+      matches.c.rank < rank,
+      and_(matches.c.rank == rank, matches.c.name > name),
+      and_(matches.c.rank == rank, matches.c.name == name, matches.c.id > id)
+    ))
+  return statement.order_by(matches.c.rank.desc(), matches.c.name, matches.c.id).limit(limit + 1)
+
+def search_results(rows, limit):
+  next_cursor = None
+  if len(rows) > limit:
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1].rank, rows[-1].name, rows[-1].id)
+
+  return {
+    "count": rows[0].count if rows else 0,
+    "data": [{
+      "id": row.id,
+      "name": row.name,
+      "num_upcoming_shows": row.num_upcoming_shows
+    } for row in rows],
+    "next_cursor": next_cursor
+  }
+
+def search_page(model, term, cursor=None, limit=None):
+  limit = limit or current_app.config['SEARCH_PAGE_SIZE']
+  statement = search_statement(model, term, db.engine.dialect.name, cursor, limit)
+  return search_results(db.session.execute(statement).all(), limit)
+
+def split_shows_statements(column, id, other, now):
+  # upcoming and past shows of one venue or artist, split and ordered by the
+  # database; each row carries the id, name, image and last change of the
+  # other side as e.g. artist_id, artist_name, artist_image_link and
+  # artist_updated_at
+  prefix = other.__tablename__.lower() + '_'
+  shows = select(
+    other.id.label(prefix + 'id'),
+    other.name.label(prefix + 'name'),
+    other.image_link.label(prefix + 'image_link'),
+    other.updated_at.label(prefix + 'updated_at'),
+    Show.start_time
+  ).select_from(Show).join(other).where(column == id)
+  upcoming_shows = shows.where(Show.start_time > now).order_by(Show.start_time)
+  past_shows = shows.where(Show.start_time <= now).order_by(Show.start_time.desc())
+  return upcoming_shows, past_shows
+
+def split_shows(column, id, other):
+  upcoming_shows, past_shows = split_shows_statements(column, id, other, datetime.today())
+  return db.session.execute(upcoming_shows).all(), db.session.execute(past_shows).all()
+
+def genres_statement(model, ids):
+  # genre names of each venue or artist in ids, from one query
+  table, column = (venue_genre, 'venue_id') if model is Venue else (artist_genre, 'artist_id')
+  return select(table.c[column], Genre.name) \
+    .join(Genre, Genre.id == table.c.genre_id) \
+    .where(table.c[column].in_(ids)) \
+    .order_by(table.c[column], Genre.name)
+
+def group_genres(rows, ids):
+  genres = {id: [] for id in ids}
+  for id, name in rows:
+    genres[id].append(name)
+  return genres
+
+def record_genres(model, ids):
+  return group_genres(db.session.execute(genres_statement(model, ids)), ids)
+
+def show_listing(cursor=None):
+  # shows with their venue and artist, newest first, continuing below the
+  # (start_time, id) of the last show on the previous page
+  statement = select(
+    Show.id,
+    Show.start_time,
+    Venue.id.label('venue_id'),
+    Venue.name.label('venue_name'),
+    Venue.updated_at.label('venue_updated_at'),
+    Artist.id.label('artist_id'),
+    Artist.name.label('artist_name'),
+    Artist.image_link.label('artist_image_link'),
+    Artist.updated_at.label('artist_updated_at')
+  ).join(Venue, Show.venue).join(Artist, Show.artist)
+
+  position = decode_cursor(cursor)
+  if position:
+    try:
+      start_time, id = datetime.fromisoformat(position[0]), position[1]
+    except (ValueError, TypeError, IndexError):
+      return statement.where(false())
+    statement = statement.where(or_(
+      Show.start_time < start_time,
+      and_(Show.start_time == start_time, Show.id < id)
+    ))
+  return statement.order_by(Show.start_time.desc(), Show.id.desc())
+
+def show_cursor(show):
+  return encode_cursor(show.start_time.isoformat(), show.id)
+
+#----------------------------------------------------------------------------#
+# Writes.
+#----------------------------------------------------------------------------#
+
+# name -> id of every genre in the Genres vocabulary, loaded once per process
+genre_ids = {}
+
+def insert_ignoring_conflicts(table):
+  # INSERT that skips rows colliding with a unique constraint
+  dialect = db.engine.dialect.name
+  if dialect == 'postgresql':
+    return postgresql.insert(table).on_conflict_do_nothing()
+  if dialect == 'sqlite':
+    return sqlite.insert(table).on_conflict_do_nothing()
+  return table.insert()
+
+def load_genres():
+  # upsert the Genres vocabulary and cache its ids; this runs on its own
+  # connection so it never commits a request's pending changes, and the unique
+  # constraint on Genre.name keeps concurrent workers from creating duplicates
+  names = [genre.value for genre in Genres]
+  with db.engine.begin() as connection:
+    connection.execute(insert_ignoring_conflicts(Genre.__table__), [{"name": name} for name in names])
+    genre_ids.update(connection.execute(
+      db.select(Genre.name, Genre.id).where(Genre.name.in_(names))
+    ).fetchall())
+  return genre_ids
+
+def set_genres(table, column, id, names):
+  # replace the genres of one venue or artist with one delete and one bulk insert
+  ids = genre_ids or load_genres()
+  db.session.execute(table.delete().where(table.c[column] == id))
+  rows = [{column: id, "genre_id": ids[name]} for name in dict.fromkeys(names)]
+  if rows:
+    db.session.execute(table.insert(), rows)
+
+def show_counter_values(model, show_column, now):
+  # correlated subqueries computing each show counter of a venue or artist
+  shows = db.select(func.count(Show.id)).where(show_column == model.id)
+  return {
+    "upcoming_shows_count": shows.where(Show.start_time > now).scalar_subquery(),
+    "past_shows_count": shows.where(Show.start_time <= now).scalar_subquery(),
+    "next_show_time": db.select(func.min(Show.start_time))
+      .where(show_column == model.id, Show.start_time > now)
+      .scalar_subquery()
+  }
+
+def show_counter_filter(model, values, condition=None, drifted=False):
+  clauses = [] if condition is None else [condition]
+  if drifted:
+    clauses.append(or_(*[getattr(model, name).is_distinct_from(value) for name, value in values.items()]))
+  return clauses
+
+def refresh_show_counters(model, show_column, condition=None, drifted=False):
+  # recompute the show counters of the venues or artists matching condition
+  # with one set-based UPDATE inside the caller's transaction; with drifted,
+  # only rows whose stored counters are wrong are written
+  values = show_counter_values(model, show_column, datetime.today())
+  statement = db.update(model).values(**values) \
+    .where(*show_counter_filter(model, values, condition, drifted))
+  return db.session.execute(statement.execution_options(synchronize_session=False)).rowcount
+
+def stale_show_counters(model, show_column, condition=None, drifted=False):
+  # ids of the rows refresh_show_counters() is about to write, for
+  # invalidating their cached pages
+  values = show_counter_values(model, show_column, datetime.today())
+  return [id for (id,) in db.session.execute(
+    db.select(model.id).where(*show_counter_filter(model, values, condition, drifted)))]
+
+def roll_over_show_counters():
+  # move shows that have started from the upcoming to the past counters;
+  # returns the ids of the venues and of the artists rolled over
+  now = datetime.today()
+  rolled = []
+  for model, show_column in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+    rolled.append(stale_show_counters(model, show_column, model.next_show_time <= now))
+    refresh_show_counters(model, show_column, model.next_show_time <= now)
+  return rolled
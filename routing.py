@@ -0,0 +1,185 @@
+import os
+import time
+import threading
+from itertools import count
+from flask import current_app, request, session, g, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, event, orm, text
+
+#----------------------------------------------------------------------------#
+# Read replicas.
+#----------------------------------------------------------------------------#
+# With SQLALCHEMY_REPLICA_URIS set, the queries of GET requests run on one of
+# the replicas, picked per request by round robin or by the fewest connections
+# in use. Everything else runs on the primary: requests with other methods,
+# flushes and DML, CLI commands, and the GET requests of a user who has written
+# within the last REPLICA_STICKY_SECONDS, so they read their own writes even
+# while the replicas lag behind.
+#
+# Every replica is checked with SELECT 1 each REPLICA_HEALTH_INTERVAL seconds,
+# from a thread of each worker process. A replica failing a check, or losing
+# its connection during a request, is ejected until a check passes again; with
+# no healthy replica left, reads go to the primary.
+#
+# Under `uvicorn asgi:app` the async read path picks its replica the same way,
+# from async engines attached to these replicas, and reads the primary for
+# users within their REPLICA_STICKY_SECONDS.
+#
+# Replicas lag behind the primary, so a page cached right after a write may be
+# rendered from a replica that does not have it yet; it is replaced when the
+# page expires after PAGE_CACHE_TIMEOUT seconds.
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+class Replica:
+
+    def __init__(self, uri, options):
+        self.uri = uri
+        self.engine = create_engine(uri, **options)
+        self.healthy = True
+        self.in_use = 0
+        self.async_engine = None
+        self.lock = threading.Lock()
+        self.watch(self.engine)
+
+    def watch(self, engine):
+        event.listen(engine, 'checkout', self.checked_out)
+        event.listen(engine, 'checkin', self.checked_in)
+        event.listen(engine, 'handle_error', self.failed)
+
+    def attach_async(self, engine):
+        # the engine of the ASGI read path, see asgi.py; its connections and
+        # errors count toward the same selection and health as the sync ones
+        self.async_engine = engine
+        self.watch(engine.sync_engine)
+
+    def checked_out(self, dbapi_connection, connection_record, connection_proxy):
+        with self.lock:
+            self.in_use += 1
+
+    def checked_in(self, dbapi_connection, connection_record):
+        with self.lock:
+            self.in_use -= 1
+
+    def failed(self, context):
+        # errors connecting or lost connections eject the replica at once
+        if context.connection is None or context.is_disconnect:
+            self.healthy = False
+
+    def check(self):
+        try:
+            with self.engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+            self.healthy = True
+        except Exception:
+            self.healthy = False
+        return self.healthy
+
+    def status(self):
+        # the URI without its password, for /pool
+        return {'uri': repr(self.engine.url), 'healthy': self.healthy, 'in_use': self.in_use}
+
+class Replicas:
+
+    def __init__(self, app=None):
+        self.replicas = []
+        self.turns = count()
+        self.monitor_pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        self.replicas = [Replica(uri, options) for uri in app.config.get('SQLALCHEMY_REPLICA_URIS') or ()]
+        self.selection = app.config.get('REPLICA_SELECTION', 'round-robin')
+        self.sticky = app.config.get('REPLICA_STICKY_SECONDS', 10)
+        self.interval = app.config.get('REPLICA_HEALTH_INTERVAL', 5)
+        app.extensions['replicas'] = self
+        if self.replicas:
+            app.before_request(self.route_request)
+            app.after_request(self.note_write)
+
+    def read_only(self, view):
+        # marks a view taking POST requests that only reads, so its queries
+        # run on the replicas like those of GET requests
+        view.read_only = True
+        return view
+
+    def route_request(self):
+        view = current_app.view_functions.get(request.endpoint)
+        reads = request.method in SAFE_METHODS or getattr(view, 'read_only', False)
+        g.read_replica = reads and time.time() >= session.get('primary_until', 0)
+
+    def note_write(self, response):
+        # only requests that committed changes pin their user to the primary
+        if g.get('wrote'):
+            session['primary_until'] = time.time() + self.sticky
+        return response
+
+    def choose(self):
+        # a healthy replica, or None for the primary
+        self.start_monitor()
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        # start from the next replica in turn, so ties are spread evenly
+        turn = next(self.turns) % len(healthy)
+        healthy = healthy[turn:] + healthy[:turn]
+        if self.selection == 'least-connections':
+            return min(healthy, key=lambda replica: replica.in_use)
+        return healthy[0]
+
+    def start_monitor(self):
+        # one health check thread per worker process, started on first use
+        # so it survives forking servers
+        if self.monitor_pid != os.getpid():
+            self.monitor_pid = os.getpid()
+            threading.Thread(target=self.monitor, daemon=True).start()
+
+    def monitor(self):
+        while True:
+            time.sleep(self.interval)
+            for replica in self.replicas:
+                replica.check()
+
+    def status(self):
+        return [replica.status() for replica in self.replicas]
+
+class RoutingSession(SignallingSession):
+    # binds the reads of a session to the replica chosen for its request
+
+    def get_bind(self, mapper=None, clause=None):
+        if not self._flushing and not getattr(clause, 'is_dml', False) \
+                and has_request_context() and g.get('read_replica'):
+            if 'replica' not in self.info:
+                replicas = self.app.extensions.get('replicas')
+                self.info['replica'] = replicas.choose() if replicas else None
+            if self.info['replica'] is not None:
+                return self.info['replica'].engine
+        return super().get_bind(mapper, clause)
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+@event.listens_for(RoutingSession, 'after_flush')
+def note_flush(session, flush_context):
+    if session.new or session.deleted or any(session.is_modified(instance) for instance in session.dirty):
+        session.info['wrote'] = True
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def note_statement(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['wrote'] = True
+
+@event.listens_for(RoutingSession, 'after_commit')
+def note_commit(session):
+    if session.info.pop('wrote', False) and has_request_context():
+        g.wrote = True
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def forget_writes(session, transaction):
+    # writes rolled back or closed without a commit
+    if transaction.parent is None:
+        session.info.pop('wrote', None)
@@ -0,0 +1,152 @@
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_
+from models import db, Venue, Artist, Show
+from queries import refresh_show_counters
+from importer import reserve_ids
+
+#----------------------------------------------------------------------------#
+# Bulk show scheduling.
+#----------------------------------------------------------------------------#
+# Many shows are booked in one call, such as the dates of a tour. Every show
+# holds its venue and its artist for SHOW_LENGTH minutes from its start time,
+# and a show starting within that time of another show of the same venue or
+# artist is a double booking.
+#
+# Venue and artist ids are checked with one query per table, which also locks
+# the rows on Postgres so concurrent bookings of the same venue or artist wait
+# for each other. Existing shows near the requested times are read with one
+# range query per side over the (venue_id, start_time) and (artist_id,
+# start_time) indexes. The valid shows are then inserted in a single
+# transaction and every submitted show gets a result: created with its id, or
+# rejected with its errors. The new show form books its one show through here
+# too, since the locks only keep out double bookings if every writer takes them.
+
+# venues or artists per OR-ed range condition of one conflict query
+RANGES_PER_QUERY = 500
+
+def parse_show(show):
+  # (row, errors) for one submitted show
+  if not isinstance(show, dict):
+    return None, {'show': ['Not an object.']}
+  row, errors = {}, {}
+  for name in ('venue_id', 'artist_id'):
+    value = show.get(name)
+    try:
+      if isinstance(value, (bool, float)):
+        raise ValueError
+      row[name] = int(value)
+    except (TypeError, ValueError):
+      errors[name] = ['Not an id.']
+  start_time = show.get('start_time')
+  try:
+    if not isinstance(start_time, datetime):
+      start_time = datetime.fromisoformat(str(start_time).strip())
+    if start_time.tzinfo is not None:
+      # start times are stored as naive local times
+      start_time = start_time.astimezone().replace(tzinfo=None)
+    row['start_time'] = start_time
+  except ValueError:
+    errors['start_time'] = ['Not an ISO 8601 date and time.']
+  return (None, errors) if errors else (row, None)
+
+def existing_ids(model, ids):
+  # the ids that exist, locked until the end of the transaction on databases
+  # that support row locks
+  if not ids:
+    return set()
+  query = db.session.query(model.id).filter(model.id.in_(ids)).order_by(model.id)
+  return {id for id, in query.with_for_update()}
+
+def booked_times(column, starts, length):
+  # venue or artist id -> sorted (start time, show id) of its existing shows
+  # starting less than length before or after one of the requested times
+  booked = {}
+  keys = sorted(starts)
+  for offset in range(0, len(keys), RANGES_PER_QUERY):
+    ranges = [
+      and_(column == key, Show.start_time > min(starts[key]) - length, Show.start_time < max(starts[key]) + length)
+      for key in keys[offset:offset + RANGES_PER_QUERY]
+    ]
+    for key, start_time, id in db.session.query(column, Show.start_time, Show.id).filter(or_(*ranges)):
+      booked.setdefault(key, []).append((start_time, id))
+  for times in booked.values():
+    times.sort()
+  return booked
+
+def overlapping(times, start_time, length):
+  # the first (start time, owner) of sorted times closer than length to start_time
+  index = bisect_left(times, (start_time - length + timedelta(microseconds=1),))
+  if index < len(times) and times[index][0] < start_time + length:
+    return times[index]
+  return None
+
+def schedule_shows(shows, length, dry_run=False):
+  # book shows and return the per-show results with the page cache tags
+  # that changed; with dry_run, nothing is written
+  results = [{'index': index} for index in range(len(shows))]
+  rows = []
+  for result, show in zip(results, shows):
+    row, errors = parse_show(show)
+    if errors:
+      result.update(status='rejected', errors=errors)
+    else:
+      rows.append((result, row))
+
+  venues = existing_ids(Venue, {row['venue_id'] for result, row in rows})
+  artists = existing_ids(Artist, {row['artist_id'] for result, row in rows})
+  sides = []
+  for name, column, found, label in (('venue_id', Show.venue_id, venues, 'venue'), ('artist_id', Show.artist_id, artists, 'artist')):
+    starts = {}
+    for result, row in rows:
+      if row[name] in found:
+        starts.setdefault(row[name], []).append(row['start_time'])
+    # existing shows as (start time, show id) and accepted shows of this
+    # batch as (start time, index), per venue or artist
+    sides.append((name, label, found, booked_times(column, starts, length), {}))
+
+  # shows earlier in the batch win over later ones they overlap
+  accepted = []
+  for result, row in rows:
+    errors = {}
+    for name, label, found, booked, batch in sides:
+      if row[name] not in found:
+        errors[name] = ['No {} with this id.'.format(label)]
+        continue
+      conflict = overlapping(booked.get(row[name], []), row['start_time'], length)
+      if conflict:
+        errors[name] = ['The {} has show {} at {}.'.format(label, conflict[1], conflict[0].isoformat())]
+        continue
+      conflict = overlapping(batch.get(row[name], []), row['start_time'], length)
+      if conflict:
+        errors[name] = ['The {} is booked by an earlier show of this batch at {}.'.format(label, conflict[0].isoformat())]
+    if errors:
+      result.update(status='rejected', errors=errors)
+      continue
+    for name, label, found, booked, batch in sides:
+      insort(batch.setdefault(row[name], []), (row['start_time'], result['index']))
+    accepted.append((result, row))
+
+  tags = set()
+  if accepted and not dry_run:
+    for id, (result, row) in zip(reserve_ids(Show, len(accepted)), accepted):
+      row['id'] = id
+    db.session.execute(Show.__table__.insert(), [row for result, row in accepted])
+    venue_ids = {row['venue_id'] for result, row in accepted}
+    artist_ids = {row['artist_id'] for result, row in accepted}
+    refresh_show_counters(Venue, Show.venue_id, Venue.id.in_(venue_ids))
+    refresh_show_counters(Artist, Show.artist_id, Artist.id.in_(artist_ids))
+    tags.update(['shows', 'venues'])
+    tags.update('venue:{}'.format(id) for id in venue_ids)
+    tags.update('artist:{}'.format(id) for id in artist_ids)
+  for result, row in accepted:
+    result['status'] = 'valid' if dry_run else 'created'
+    if not dry_run:
+      result['id'] = row['id']
+  return results, tags
+
+def summarize(results):
+  counts = {}
+  for result in results:
+    counts[result['status']] = counts.get(result['status'], 0) + 1
+  return counts
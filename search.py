@@ -0,0 +1,154 @@
+from sqlalchemy import DDL, event, text, column, case, func, select, table, union, or_, Integer
+from sqlalchemy.dialects import postgresql
+from forms import Genres
+
+#----------------------------------------------------------------------------#
+# Search index.
+#----------------------------------------------------------------------------#
+# Venues and artists are searchable by name, city, state and genre. A term
+# matches when it is a case-insensitive substring of the name, the city, the
+# state or one genre name, the same on both backends; it never matches across
+# two of them.
+#
+# On PostgreSQL one pg_trgm GIN index per table covers name, city and state
+# together, as a single expression, so a case-insensitive substring match is
+# one bitmap index scan. Genres come from the fixed Genres vocabulary, so the
+# ones matching the term are found without a query and their venues or
+# artists are added with UNION through the genre association index: OR-ing
+# the columns, or an EXISTS over the genres, into one condition leaves the
+# planner no choice but a sequential scan.
+#
+# On SQLite an FTS5 table with the trigram tokenizer mirrors each searchable
+# table and is kept up to date by triggers, so every write path (forms, bulk
+# loads, raw SQL) maintains it. Searches filter it on the name, city and state
+# columns, each matched on its own, and take genres through the association
+# table as on PostgreSQL; its genres column joins the names of a row's genres
+# and would let a term span two of them.
+
+# trigram indexes cannot serve terms shorter than a single trigram
+MIN_INDEXED_TERM = 3
+
+SEARCHABLE = {
+  'Venue': 'venue_genre',
+  'Artist': 'artist_genre',
+}
+
+def search_table(tablename):
+  return tablename.lower() + '_search'
+
+def sqlite_search_ddl(tablename, genre_table):
+  # FTS5 table keyed by the entity id plus the triggers that maintain it
+  names = {
+    'fts': search_table(tablename),
+    'table': tablename,
+    'genre_table': genre_table,
+    'fk': tablename.lower() + '_id',
+  }
+  genres = (
+    'SELECT group_concat(g.name, \' \') FROM {genre_table} AS a '
+    'JOIN "Genre" AS g ON g.id = a.genre_id WHERE a.{fk} = {row}.{fk}'
+  )
+  statements = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {fts} "
+    "USING fts5(name, city, state, genres, tokenize='trigram')",
+
+    'CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON "{table}" BEGIN '
+    'INSERT INTO {fts} (rowid, name, city, state, genres) '
+    'VALUES (new.id, new.name, new.city, new.state, \'\'); END',
+
+    'CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE ON "{table}" BEGIN '
+    'UPDATE {fts} SET name = new.name, city = new.city, state = new.state '
+    'WHERE rowid = new.id; END',
+
+    'CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON "{table}" BEGIN '
+    'DELETE FROM {fts} WHERE rowid = old.id; END',
+
+    'CREATE TRIGGER IF NOT EXISTS {fts}_genre_insert AFTER INSERT ON {genre_table} BEGIN '
+    'UPDATE {fts} SET genres = (' + genres.replace('{row}', 'new') + ') '
+    'WHERE rowid = new.{fk}; END',
+
+    'CREATE TRIGGER IF NOT EXISTS {fts}_genre_delete AFTER DELETE ON {genre_table} BEGIN '
+    'UPDATE {fts} SET genres = coalesce((' + genres.replace('{row}', 'old') + '), \'\') '
+    'WHERE rowid = old.{fk}; END',
+  ]
+  return [statement.format(**names) for statement in statements]
+
+def sqlite_search_backfill(tablename, genre_table):
+  # populate the FTS5 table from rows that predate it
+  fk = tablename.lower() + '_id'
+  return (
+    'INSERT INTO {fts} (rowid, name, city, state, genres) '
+    'SELECT t.id, t.name, t.city, t.state, coalesce(('
+    'SELECT group_concat(g.name, \' \') FROM {genre_table} AS a '
+    'JOIN "Genre" AS g ON g.id = a.genre_id WHERE a.{fk} = t.id), \'\') '
+    'FROM "{table}" AS t'
+  ).format(fts=search_table(tablename), table=tablename, genre_table=genre_table, fk=fk)
+
+def search_document(columns):
+  # name, city and state as one string, the expression of the trigram index;
+  # the literals are inlined rather than bound so the expression of a query
+  # matches the index with drivers that send parameters separately
+  document = None
+  for name in ('name', 'city', 'state'):
+    value = func.coalesce(columns[name], text("''"))
+    document = value if document is None else document.op('||')(text("' '")).op('||')(value)
+  return document
+
+def postgres_search_index(table):
+  document = search_document(table.c).compile(dialect=postgresql.dialect())
+  return 'CREATE INDEX IF NOT EXISTS "ix_{0}_search_trgm" ON "{0}" USING gin (({1}) gin_trgm_ops)'.format(table.name, document)
+
+def register_search_ddl(metadata):
+  # create the search index alongside the tables on metadata.create_all()
+  event.listen(
+    metadata, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+  )
+  for tablename, genre_table in SEARCHABLE.items():
+    event.listen(metadata, 'after_create', DDL(postgres_search_index(metadata.tables[tablename])).execute_if(dialect='postgresql'))
+    for statement in sqlite_search_ddl(tablename, genre_table):
+      event.listen(metadata, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+#----------------------------------------------------------------------------#
+# Ranked queries.
+#----------------------------------------------------------------------------#
+
+def escape_like(term):
+  return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def search_condition(model, term, dialect):
+  # rows of model matching term on name, city, state or genre; the term must
+  # fall within one of them, on every backend, so "Hall San" does not match
+  # The Hall in San Francisco
+  if dialect == 'sqlite' and len(term) >= MIN_INDEXED_TERM:
+    fts = search_table(model.__tablename__)
+    matches = select(table(fts, column('rowid', Integer)).c.rowid).where(text(
+      '{fts} MATCH :{fts}_term'.format(fts=fts)
+    ).bindparams(**{fts + '_term': '{name city state} : "' + term.replace('"', '""') + '"'}))
+  else:
+    # the document finds the candidates through the trigram index, the
+    # columns then drop those matching only across a column boundary
+    pattern = '%' + escape_like(term) + '%'
+    columns = model.__table__.c
+    matches = select(model.id).where(
+      search_document(columns).ilike(pattern, escape='\\'),
+      or_(*[columns[name].ilike(pattern, escape='\\') for name in ('name', 'city', 'state')]))
+  names = [genre.value for genre in Genres if term.lower() in genre.value.lower()]
+  if names:
+    secondary = model.genres.property.secondary
+    genre = model.genres.property.mapper.class_
+    matches = union(matches, select(secondary.c[model.__tablename__.lower() + '_id'])
+      .join(genre, genre.id == secondary.c.genre_id)
+      .where(genre.name.in_(names)))
+  return model.id.in_(matches)
+
+def search_rank(model, term):
+  # exact name matches rank above name prefixes, which rank above name
+  # substrings; rows matched only on city, state or genre come last
+  prefix = escape_like(term) + '%'
+  return case(
+    (func.lower(model.name) == term.lower(), 3),
+    (model.name.ilike(prefix, escape='\\'), 2),
+    (model.name.ilike('%' + prefix, escape='\\'), 1),
+    else_=0
+  )
@@ -0,0 +1,90 @@
+import os
+import sys
+import json
+import time
+from jinja2 import FileSystemBytecodeCache
+
+#----------------------------------------------------------------------------#
+# Startup.
+#----------------------------------------------------------------------------#
+# A new worker process, started by a deploy or recycled by gunicorn's
+# --max-requests, pays for its imports and for compiling every template it
+# renders on its first requests. Compiled templates are written to a bytecode
+# cache on disk, so the next worker loads them instead of compiling them again,
+# and `flask compile-templates` fills the cache ahead of time, such as in a
+# deploy step. With PRECOMPILE_TEMPLATES, each worker loads every template
+# before it serves a request, or once in the master with gunicorn --preload.
+#
+# `flask profile-startup` reports both costs from fresh processes: the import
+# time of the app and its heaviest imports, then the first and second request
+# of a few pages, with the bytecode cache empty and filled.
+
+def init_templates(app):
+  if app.config['TEMPLATE_BYTECODE_CACHE']:
+    # jinja's per-user directory of the system temporary directory by default
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR'])
+
+def compile_templates(app):
+  # load every page template into the environment, compiling and caching the
+  # ones missing from the bytecode cache; the filters and extensions they use
+  # must be registered first
+  names = app.jinja_env.list_templates(extensions=['html'])
+  for name in names:
+    app.jinja_env.get_template(name)
+  return names
+
+STARTUP_PATHS = ('/', '/venues', '/venues/1', '/artists', '/artists/1', '/shows', '/shows/create', '/venues/create')
+
+def measure(paths):
+  # run in a fresh process by profile_startup: the import time of the app,
+  # then the first and second request of each path, printed as JSON
+  started = time.perf_counter()
+  from app import app
+  imported = time.perf_counter() - started
+  client = app.test_client()
+  requests = []
+  for path in paths:
+    timings = []
+    for attempt in range(2):
+      started = time.perf_counter()
+      status = client.get(path).status_code
+      timings.append(time.perf_counter() - started)
+    requests.append({'path': path, 'status': status, 'first': timings[0], 'second': timings[1]})
+  print(json.dumps({'import': imported, 'requests': requests}))
+
+def import_times(lines, limit):
+  # the direct imports of the app by cumulative time, from -X importtime
+  children, imports = [], []
+  for line in lines:
+    if not line.startswith('import time:'):
+      continue
+    self_time, cumulative, name = line[len('import time:'):].split('|')
+    if not cumulative.strip().isdigit():
+      continue
+    depth = (len(name) - len(name.lstrip()) - 1) // 2
+    if depth == 1:
+      children.append((name.strip(), int(cumulative) / 1e6))
+    elif depth == 0:
+      if name.strip() == 'app':
+        imports = children
+      children = []
+  return sorted(imports, key=lambda item: -item[1])[:limit]
+
+def profile_startup(root, paths=STARTUP_PATHS, limit=15):
+  # one run with an empty bytecode cache, as after a template change, and one
+  # with the cache it left behind, as a recycled worker; the page cache is
+  # disabled so every request renders its page; subprocess and tempfile are
+  # imported here, since workers import this module for init_templates
+  import tempfile
+  import subprocess
+  runs = {}
+  with tempfile.TemporaryDirectory() as directory:
+    env = dict(os.environ, PAGE_CACHE_TYPE='null', TEMPLATE_BYTECODE_CACHE='1', TEMPLATE_CACHE_DIR=directory, PRECOMPILE_TEMPLATES='0')
+    for run in ('compiled', 'cached'):
+      command = [sys.executable, '-X', 'importtime', '-c', 'import sys, startup; startup.measure(sys.argv[1:])'] + list(paths)
+      process = subprocess.run(command, cwd=root, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+      if process.returncode:
+        raise RuntimeError('the profiled process failed:\n' + process.stderr[-2000:])
+      runs[run] = json.loads(process.stdout.strip().splitlines()[-1])
+      runs[run]['imports'] = import_times(process.stderr.splitlines(), limit)
+  return runs
@@ -0,0 +1,47 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+# the app reads its configuration from the environment when it is imported:
+# a throwaway SQLite database, and no caches keeping pages from being rendered
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'fyyur.db')
+os.environ['PAGE_CACHE_TYPE'] = 'null'
+os.environ['FRAGMENT_CACHE_TYPE'] = 'null'
+os.environ['TEMPLATE_BYTECODE_CACHE'] = '0'
+
+import pytest
+from sqlalchemy import event
+from app import app as flask_app
+from models import db
+from queries import load_genres
+from benchmark import reset_database
+
+@pytest.fixture
+def app():
+  # a fresh database per test; forms are posted without a CSRF token
+  flask_app.config['WTF_CSRF_ENABLED'] = False
+  with flask_app.app_context():
+    reset_database()
+    load_genres()
+    yield flask_app
+    db.session.remove()
+
+@pytest.fixture
+def client(app):
+  return app.test_client()
+
+@contextmanager
+def recorded_statements():
+  # the SQL statements sent to the database inside the block
+  statements = []
+  def record(connection, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+  event.listen(db.engine, 'before_cursor_execute', record)
+  try:
+    yield statements
+  finally:
+    event.remove(db.engine, 'before_cursor_execute', record)
+
+@pytest.fixture
+def statements(app):
+  return recorded_statements
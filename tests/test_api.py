@@ -0,0 +1,38 @@
+import base64
+import json
+import pytest
+from models import db, Venue
+
+def cursor(value):
+  return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+MALFORMED = ['not-base64!', cursor(None), cursor('abc'), cursor([True, 'a', 1]), cursor([1, 2, 3]), cursor({'id': 1})]
+
+@pytest.fixture
+def venues(app):
+  for number in range(3):
+    db.session.add(Venue(name='The Hall {}'.format(number), city='San Francisco', state='CA'))
+  db.session.commit()
+
+def test_search_pages_follow_their_cursor(client, venues):
+  first = client.get('/api/v1/venues/search?search_term=hall&limit=2').get_json()
+  assert [venue['name'] for venue in first['data']] == ['The Hall 0', 'The Hall 1']
+  rest = client.get('/api/v1/venues/search', query_string={'search_term': 'hall', 'limit': 2, 'cursor': first['next_cursor']}).get_json()
+  assert [venue['name'] for venue in rest['data']] == ['The Hall 2']
+  assert rest['next_cursor'] is None
+
+@pytest.mark.parametrize('path', ['/api/v1/venues/search', '/api/v1/artists/search'])
+@pytest.mark.parametrize('value', MALFORMED + [cursor([1, 'a'])])
+def test_search_rejects_malformed_cursors(client, venues, path, value):
+  response = client.get(path, query_string={'search_term': 'hall', 'cursor': value})
+  assert response.status_code == 400
+
+@pytest.mark.parametrize('path', ['/api/v1/venues', '/api/v1/artists'])
+@pytest.mark.parametrize('value', MALFORMED + [cursor([1, 'a', 1])])
+def test_list_rejects_malformed_cursors(client, venues, path, value):
+  assert client.get(path, query_string={'cursor': value}).status_code == 400
+
+def test_search_form_shows_no_results_for_malformed_cursors(client, venues):
+  response = client.post('/venues/search', data={'search_term': 'hall', 'cursor': cursor([1, 2, 3])})
+  assert response.status_code == 200
+  assert b'The Hall' not in response.data
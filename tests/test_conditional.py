@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+from models import db, Venue, Artist, Show, TableVersion
+from cache import MemoryCache
+from app import page_cache
+
+def book():
+  venue = Venue(name='The Hall', city='San Francisco', state='CA')
+  artist = Artist(name='The Band', city='San Francisco', state='CA')
+  db.session.add(Artist(name='The Trio', city='San Francisco', state='CA'))
+  db.session.add(Show(venue=venue, artist=artist, start_time=datetime.today() + timedelta(days=1)))
+  db.session.commit()
+  ids = venue.id, artist.id
+  # Last-Modified has whole seconds: leave the second of the setup behind
+  earlier = datetime.utcnow() - timedelta(minutes=1)
+  for model in (Venue, Artist, Show):
+    db.session.execute(db.update(model).values(updated_at=earlier))
+  db.session.commit()
+  db.session.execute(db.update(TableVersion).values(changed_at=earlier))
+  db.session.commit()
+  return ids
+
+def test_listing_revalidation_is_one_query(client, statements):
+  book()
+  etag = client.get('/shows').headers['ETag']
+  with statements() as run:
+    response = client.get('/shows', headers={'If-None-Match': etag})
+  assert response.status_code == 304
+  assert len(run) == 1
+
+def test_deletes_change_listing_validators(client):
+  venue_id, artist_id = book()
+  page = client.get('/artists')
+  assert b'The Band' in page.data
+  last_modified, etag = page.headers['Last-Modified'], page.headers['ETag']
+  assert client.get('/artists', headers={'If-Modified-Since': last_modified}).status_code == 304
+
+  assert client.delete('/artists/{}'.format(artist_id)).status_code == 200
+  for headers in ({'If-Modified-Since': last_modified}, {'If-None-Match': etag}):
+    response = client.get('/artists', headers=headers)
+    assert response.status_code == 200
+    assert b'The Band' not in response.data
+
+def test_cached_bodies_match_their_etag(client, monkeypatch):
+  monkeypatch.setattr(page_cache, 'backend', MemoryCache())
+  book()
+  page = client.get('/venues')
+  assert b'The Club' not in page.data
+
+  # a write no page cache tag hears of, like an import in another process
+  db.session.add(Venue(name='The Club', city='San Francisco', state='CA'))
+  db.session.commit()
+  response = client.get('/venues')
+  assert response.headers['ETag'] != page.headers['ETag']
+  assert b'The Club' in response.data
+  assert client.get('/venues', headers={'If-None-Match': page.headers['ETag']}).status_code == 200
+  assert client.get('/venues', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta
+import pytest
+from models import db, Venue, Artist, Show, venue_genre, artist_genre
+from queries import set_genres
+
+def book(count):
+  # a venue and an artist with count shows each, every one with a different
+  # artist or venue, alternately upcoming and past
+  now = datetime.today()
+  venue = Venue(name='The Hall', city='San Francisco', state='CA')
+  artist = Artist(name='The Band', city='San Francisco', state='CA')
+  for number in range(count):
+    start_time = now + timedelta(days=number + 1) * (1 if number % 2 else -1)
+    db.session.add(Show(venue=venue, artist=Artist(name='Artist {}'.format(number)), start_time=start_time))
+    db.session.add(Show(venue=Venue(name='Venue {}'.format(number)), artist=artist, start_time=start_time))
+  db.session.flush()
+  set_genres(venue_genre, 'venue_id', venue.id, ['Jazz', 'Blues'])
+  set_genres(artist_genre, 'artist_id', artist.id, ['Jazz', 'Funk'])
+  ids = {'venue': venue.id, 'artist': artist.id}
+  db.session.commit()
+  return ids
+
+@pytest.mark.parametrize('page', ['/venues/{venue}', '/artists/{artist}'])
+def test_detail_page_query_count_does_not_grow_with_shows(client, statements, page):
+  counts = []
+  for shows in (1, 20):
+    path = page.format(**book(shows))
+    with statements() as run:
+      response = client.get(path)
+    assert response.status_code == 200
+    assert '{} Upcoming'.format(shows // 2).encode() in response.data
+    assert '{} Past'.format((shows + 1) // 2).encode() in response.data
+    counts.append(len(run))
+  assert counts[0] == counts[1]
@@ -0,0 +1,21 @@
+from sqlalchemy import text
+from models import db
+from benchmark import seed
+
+def explain(app):
+  return app.test_cli_runner().invoke(args=['explain', '--strict'])
+
+def test_read_views_scan_only_expected_tables(app):
+  seed(50, 50, 200)
+  result = explain(app)
+  assert '0 unexpected full table scans' in result.output
+  assert '~ SCAN Venue' in result.output
+  assert result.exit_code == 0
+
+def test_missing_index_fails_the_check(app):
+  seed(50, 50, 200)
+  db.session.execute(text('DROP INDEX "ix_Show_venue_id_start_time"'))
+  db.session.commit()
+  result = explain(app)
+  assert '! SCAN Show' in result.output
+  assert result.exit_code == 1
@@ -0,0 +1,10 @@
+from models import Venue
+from queries import genre_ids
+from test_show_counters import VENUE_FORM
+
+def test_first_request_of_a_worker_saves_genres(client):
+  # a new worker has no genre ids cached when its first request writes
+  genre_ids.clear()
+  response = client.post('/venues/create', data=dict(VENUE_FORM, genres=['Jazz', 'Blues']))
+  assert b'was successfully listed' in response.data
+  assert sorted(genre.name for genre in Venue.query.one().genres) == ['Blues', 'Jazz']
@@ -0,0 +1,55 @@
+import json
+import pytest
+import importer
+from importer import import_file
+from models import Venue
+from test_show_counters import VENUE_FORM
+
+def venue_file(tmp_path, count, invalid):
+  path = tmp_path / 'venues.jsonl'
+  with open(path, 'w') as file:
+    for number in range(1, count + 1):
+      record = dict(VENUE_FORM, name='Venue {}'.format(number))
+      if number in invalid:
+        record['state'] = 'XX'
+      file.write(json.dumps(record) + '\n')
+  return str(path)
+
+class Stop(Exception):
+  pass
+
+def stop_on_call(function, call):
+  calls = []
+  def stopping(*args, **kwargs):
+    calls.append(args)
+    if len(calls) == call:
+      raise Stop()
+    return function(*args, **kwargs)
+  return stopping
+
+@pytest.mark.parametrize('stop', ['after a committed batch', 'inside a batch'])
+def test_resumed_import_neither_duplicates_nor_skips(app, tmp_path, monkeypatch, stop):
+  # ten records in batches of three, the fifth rejected; the import stops
+  # during the batch holding it or right after that batch commits
+  path = venue_file(tmp_path, 10, invalid={5})
+  checkpoint, rejects = str(tmp_path / 'checkpoint'), str(tmp_path / 'rejects.jsonl')
+  progress = None
+  if stop == 'inside a batch':
+    monkeypatch.setattr(importer, 'write_batch', stop_on_call(importer.write_batch, 2))
+  else:
+    progress = stop_on_call(lambda totals: None, 2)
+
+  with pytest.raises(Stop):
+    import_file('venues', path, batch_size=3, checkpoint=checkpoint, rejects=rejects, progress=progress)
+  done = 6 if stop == 'after a committed batch' else 3
+  assert importer.read_checkpoint(checkpoint) == done
+  assert Venue.query.count() == done - (done >= 5)
+
+  monkeypatch.undo()
+  totals = import_file('venues', path, batch_size=3, checkpoint=checkpoint, rejects=rejects)
+  assert totals['resumed'] == done
+  assert sorted(venue.name for venue in Venue.query) == sorted(
+    'Venue {}'.format(number) for number in range(1, 11) if number != 5)
+  with open(rejects) as file:
+    assert [json.loads(line)['record'] for line in file] == [5]
+  assert importer.read_checkpoint(checkpoint) == 0
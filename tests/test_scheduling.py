@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from models import db, Venue, Artist, Show
+from scheduling import overlapping, booked_times, schedule_shows
+
+LENGTH = timedelta(hours=3)
+START = datetime(2030, 6, 1, 20, 0)
+
+def add(model, name):
+  record = model(name=name, city='San Francisco', state='CA')
+  db.session.add(record)
+  db.session.commit()
+  return record.id
+
+@pytest.fixture
+def booked(app):
+  # a venue and an artist with one show at START, and a free venue and artist
+  ids = {'hall': add(Venue, 'The Hall'), 'club': add(Venue, 'The Club'),
+         'band': add(Artist, 'The Band'), 'trio': add(Artist, 'The Trio')}
+  db.session.add(Show(venue_id=ids['hall'], artist_id=ids['band'], start_time=START))
+  db.session.commit()
+  return ids
+
+@pytest.mark.parametrize('start_time, conflict', [
+  (START + LENGTH, False),
+  (START - LENGTH, False),
+  (START + LENGTH - timedelta(microseconds=1), True),
+  (START - LENGTH + timedelta(microseconds=1), True),
+  (START, True),
+])
+def test_overlapping_shows_share_part_of_their_length(start_time, conflict):
+  times = [(START - timedelta(days=1), 1), (START, 2), (START + timedelta(days=1), 3)]
+  assert overlapping(times, start_time, LENGTH) == ((START, 2) if conflict else None)
+
+def test_booked_times_reads_shows_within_the_length(booked):
+  hall = booked['hall']
+  assert booked_times(Show.venue_id, {hall: [START + LENGTH]}, LENGTH) == {}
+  assert booked_times(Show.venue_id, {hall: [START - LENGTH]}, LENGTH) == {}
+  times = booked_times(Show.venue_id, {hall: [START + LENGTH - timedelta(minutes=1)]}, LENGTH)
+  assert [start_time for start_time, id in times[hall]] == [START]
+
+def test_shows_may_start_as_another_ends(booked):
+  results, tags = schedule_shows([
+    {'venue_id': booked['hall'], 'artist_id': booked['band'], 'start_time': (START + LENGTH).isoformat()},
+    {'venue_id': booked['hall'], 'artist_id': booked['band'], 'start_time': (START - LENGTH).isoformat()},
+  ], LENGTH)
+  assert [result['status'] for result in results] == ['created', 'created']
+  assert 'venue:{}'.format(booked['hall']) in tags
+
+def test_shows_of_one_batch_conflict_with_each_other(booked):
+  later = START + timedelta(days=1)
+  results, tags = schedule_shows([
+    {'venue_id': booked['club'], 'artist_id': booked['trio'], 'start_time': later.isoformat()},
+    {'venue_id': booked['club'], 'artist_id': booked['band'], 'start_time': (later + timedelta(hours=1)).isoformat()},
+    {'venue_id': booked['hall'], 'artist_id': booked['trio'], 'start_time': (later + timedelta(hours=2)).isoformat()},
+    {'venue_id': booked['hall'], 'artist_id': booked['band'], 'start_time': (later + LENGTH).isoformat()},
+  ], LENGTH)
+  assert [result['status'] for result in results] == ['created', 'rejected', 'rejected', 'created']
+  assert list(results[1]['errors']) == ['venue_id']
+  assert 'earlier show of this batch' in results[1]['errors']['venue_id'][0]
+  assert list(results[2]['errors']) == ['artist_id']
+
+def test_aware_start_times_are_compared_in_local_time(booked):
+  # START written with another UTC offset is still the same instant
+  aware = START.astimezone().astimezone(timezone(timedelta(hours=-11)))
+  results, tags = schedule_shows([
+    {'venue_id': booked['club'], 'artist_id': booked['band'], 'start_time': aware.isoformat()},
+  ], LENGTH)
+  assert results[0]['status'] == 'rejected'
+  assert 'has show' in results[0]['errors']['artist_id'][0]
+
+def test_show_form_rejects_double_bookings(client, booked):
+  def post(venue_id, start_time):
+    return client.post('/shows/create', data={
+      'venue_id': venue_id, 'artist_id': booked['band'], 'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S')}).data
+  assert b'Show could not be listed. The artist has show' in post(booked['club'], START + timedelta(hours=1))
+  assert b'Show could not be listed. No venue with this id.' in post(booked['club'] + 100, START + timedelta(days=1))
+  assert b'Show was successfully listed!' in post(booked['club'], START + LENGTH)
+  assert Show.query.count() == 2
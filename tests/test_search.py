@@ -0,0 +1,75 @@
+import pytest
+from models import db, Venue, venue_genre
+from queries import search_statement, search_results, set_genres
+
+# the PostgreSQL condition is portable SQL, so both paths run on the SQLite
+# test database and must agree
+DIALECTS = ['sqlite', 'postgresql']
+
+def add_venues(*venues):
+  for name, city, state, genres in venues:
+    venue = Venue(name=name, city=city, state=state)
+    db.session.add(venue)
+    db.session.flush()
+    set_genres(venue_genre, 'venue_id', venue.id, genres)
+  db.session.commit()
+
+def search(term, dialect, cursor=None, limit=20):
+  return search_results(db.session.execute(search_statement(Venue, term, dialect, cursor, limit)).all(), limit)
+
+def names(term, dialect):
+  return [row['name'] for row in search(term, dialect)['data']]
+
+@pytest.fixture
+def venues(app):
+  add_venues(
+    ('The Hall', 'San Francisco', 'CA', ['Jazz']),
+    ('Hall of Fame', 'New York', 'NY', ['Rock n Roll']),
+    ('Dueling Pianos', 'Halloway', 'TX', ['Blues', 'Classical']),
+    ('Park Square', 'Seattle', 'WA', ['Folk']),
+  )
+
+@pytest.mark.parametrize('dialect', DIALECTS)
+@pytest.mark.parametrize('term, expected', [
+  ('hall', ['Hall of Fame', 'The Hall', 'Dueling Pianos']),
+  ('SAN FRAN', ['The Hall']),
+  ('ny', ['Hall of Fame']),
+  ('rock', ['Hall of Fame']),
+  ('ss', ['Dueling Pianos']),
+  ('100%', []),
+])
+def test_terms_match_one_field(venues, dialect, term, expected):
+  assert names(term, dialect) == expected
+
+@pytest.mark.parametrize('dialect', DIALECTS)
+@pytest.mark.parametrize('term', ['Hall San', 'Francisco CA', 'Blues Classical'])
+def test_terms_never_span_two_fields(venues, dialect, term):
+  assert names(term, dialect) == []
+
+@pytest.mark.parametrize('dialect', DIALECTS)
+def test_ranked_pages_cover_every_match_once(app, dialect):
+  add_venues(*[(name, 'Boston', 'MA', []) for name in (
+    'Band', 'Band', 'Bandstand', 'Band Room', 'The Band', 'Big Band', 'Brass Band', 'Banded',
+  )])
+  everything = search('band', dialect)
+  assert everything['count'] == 8
+  assert [row['name'] for row in everything['data']] == [
+    'Band', 'Band', 'Band Room', 'Banded', 'Bandstand', 'Big Band', 'Brass Band', 'The Band']
+
+  pages, cursor = [], None
+  while True:
+    page = search('band', dialect, cursor, limit=3)
+    assert page['count'] == 8
+    pages.append(page['data'])
+    cursor = page['next_cursor']
+    if cursor is None:
+      break
+  assert [len(page) for page in pages] == [3, 3, 2]
+  assert [row for page in pages for row in page] == everything['data']
+
+def test_search_view_lists_matches(client, venues):
+  response = client.post('/venues/search', data={'search_term': 'hall san'})
+  assert response.status_code == 200
+  assert b'The Hall' not in response.data
+  response = client.post('/venues/search', data={'search_term': 'The hall'})
+  assert b'The Hall' in response.data
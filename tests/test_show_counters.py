@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+from models import db, Venue, Artist, Show
+from cache import MemoryCache
+from app import page_cache
+
+VENUE_FORM = {
+  'name': 'The Hall', 'city': 'San Francisco', 'state': 'CA', 'address': '1 Main Street',
+  'phone': '123-123-1234', 'genres': ['Jazz'], 'website_link': 'https://example.com',
+  'facebook_link': 'https://facebook.com/thehall', 'image_link': 'https://example.com/hall.png',
+}
+
+def add(model, name):
+  record = model(name=name, city='San Francisco', state='CA')
+  db.session.add(record)
+  db.session.commit()
+  return record.id
+
+def post_show(client, venue_id, artist_id, start_time):
+  response = client.post('/shows/create', data={
+    'venue_id': venue_id,
+    'artist_id': artist_id,
+    'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'),
+  })
+  assert b'Show was successfully listed!' in response.data
+
+def counters(model, id):
+  record = db.session.get(model, id)
+  return record.upcoming_shows_count, record.past_shows_count, record.next_show_time
+
+def test_flush_without_show_changes_runs_no_show_queries(client, statements):
+  venue_id = add(Venue, 'The Hall')
+  with statements() as run:
+    response = client.post('/venues/{}/edit'.format(venue_id), data=dict(VENUE_FORM, name='The Big Hall'))
+  assert response.status_code == 302
+  assert db.session.get(Venue, venue_id).name == 'The Big Hall'
+  assert any(statement.startswith('UPDATE "Venue"') for statement in run)
+  assert not [statement for statement in run if '"Show"' in statement or
+    (statement.startswith('UPDATE') and 'shows_count' in statement)]
+
+def test_counters_follow_created_and_deleted_shows(client):
+  hall, club, band = add(Venue, 'The Hall'), add(Venue, 'The Club'), add(Artist, 'The Band')
+  now = datetime.today().replace(microsecond=0)
+  post_show(client, hall, band, now + timedelta(days=2))
+  post_show(client, hall, band, now - timedelta(days=2))
+  post_show(client, club, band, now + timedelta(days=5))
+
+  assert counters(Venue, hall) == (1, 1, now + timedelta(days=2))
+  assert counters(Venue, club) == (1, 0, now + timedelta(days=5))
+  assert counters(Artist, band) == (2, 1, now + timedelta(days=2))
+
+  # the database cascades the delete to the shows of the hall
+  assert client.delete('/venues/{}'.format(hall)).status_code == 200
+  assert db.session.get(Venue, hall) is None
+  assert counters(Venue, club) == (1, 0, now + timedelta(days=5))
+  assert counters(Artist, band) == (1, 0, now + timedelta(days=5))
+
+def test_roll_shows_invalidates_cached_pages(app, client, monkeypatch):
+  monkeypatch.setattr(page_cache, 'backend', MemoryCache())
+  hall, band = add(Venue, 'The Hall'), add(Artist, 'The Band')
+  post_show(client, hall, band, datetime.today() + timedelta(days=1))
+  page = '/venues/{}'.format(hall)
+  assert b'1 Upcoming' in client.get(page).data
+
+  # time passes: the show starts without any request invalidating the page
+  started = datetime.today() - timedelta(hours=1)
+  db.session.execute(db.update(Show).values(start_time=started))
+  for model in (Venue, Artist):
+    db.session.execute(db.update(model).values(next_show_time=started))
+  db.session.commit()
+
+  result = app.test_cli_runner(mix_stderr=False).invoke(args=['roll-shows'])
+  assert result.exit_code == 0
+  assert 'PAGE_CACHE_TYPE=memory is private' in result.stderr
+  assert counters(Venue, hall)[:2] == (0, 1)
+  response = client.get(page)
+  assert b'0 Upcoming' in response.data and b'1 Past' in response.data